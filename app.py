@@ -1,15 +1,422 @@
+import inspect
 import os
+import re
 import sys
-from datetime import datetime
+from datetime import datetime, date
+from functools import wraps
 
-from flask import Flask, request, jsonify, abort
+from flask import Flask, Response, request, jsonify, abort, json, make_response, stream_with_context
 from flask_cors import CORS
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.orm import load_only, undefer
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
 
-from auth.auth import AuthError, requires_auth
-from models.models import Actor, Movie, Appearance, setup_db
+from auth.auth import AuthError, requires_auth, check_permissions
+from cache.cache import response_cache
+from graph.graph import MAX_DEGREES, costar_index
+from instrumentation.instrumentation import setup_instrumentation
+from metrics.metrics import setup_metrics
+from models.models import Actor, Movie, Appearance, db, setup_db, insert_all, get_change_versions, search_query, \
+    pool_stats, POOL_DEFAULTS
 
+# Keyset pagination of the list endpoints
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
-def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py')):
+
+def get_sort(sorts):
+    """
+    Reads the sort order of the request (?sort=key, or ?sort=-key for the reverse order).
+    :param sorts: dict of sort key -> (column, descending) tuples
+    :return: (column, descending) tuple or None to sort by id
+    Aborts with a 422 if the key is not one of sorts.
+    """
+    key = request.args.get('sort')
+    if key is None:
+        return None
+    reverse = key.startswith('-')
+    if key.lstrip('-') not in sorts:
+        abort(422)
+    column, descending = sorts[key.lstrip('-')]
+    return column, descending != reverse
+
+
+def encode_cursor(row, sort=None):
+    if sort is None:
+        return row.id
+    value = getattr(row, sort[0].key)
+    value = value.isoformat() if isinstance(value, (datetime, date)) else value
+    return f'{value},{row.id}'
+
+
+def decode_cursor(cursor, sort=None):
+    """
+    Decodes the after argument: an id, or a 'value,id' pair when the pages are sorted by a column.
+    Raises a ValueError if it is malformed.
+    """
+    if sort is None:
+        return int(cursor)
+    value, row_id = cursor.rsplit(',', 1)
+    if sort[0].type.python_type is datetime:
+        return datetime.fromisoformat(value), int(row_id)
+    return sort[0].type.python_type(value), int(row_id)
+
+
+def get_page_arguments(sort=None):
+    """
+    Reads the keyset pagination arguments of the request (?limit=&after=).
+    Aborts with a 422 if they are not valid.
+    :return: (limit, after) tuple, after being None for the first page
+    """
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE))
+        after = request.args.get('after')
+        after = decode_cursor(after, sort) if after is not None else None
+    except ValueError:
+        abort(422)
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        abort(422)
+    return limit, after
+
+
+def paginate(query, model, limit, after=None, sort=None):
+    """
+    Returns a page of the query ordered by primary key (or by the sort column, then primary key), starting
+    right after the given cursor.
+    Seeking by key instead of using OFFSET keeps the cost of a page constant no matter how deep it is.
+    :return: (rows, next_cursor) tuple, next_cursor being None for the last page
+    """
+    if sort is None:
+        if after is not None:
+            query = query.filter(model.id > after)
+        query = query.order_by(model.id)
+    else:
+        column, descending = sort
+        if after is not None:
+            value, row_id = after
+            query = query.filter(or_(column < value if descending else column > value,
+                                     and_(column == value, model.id > row_id)))
+        # The sort column is needed for the cursor even if it is not one of the requested fields
+        query = query.options(undefer(column)).order_by(column.desc() if descending else column, model.id)
+    rows = query.limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1], sort) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def get_fields(model):
+    """
+    Reads the sparse fieldset of the request (?fields=id,name), None if every field is requested.
+    Aborts with a 422 if it contains a field the model representation doesn't have.
+    """
+    fields = request.args.get('fields')
+    if fields is None:
+        return None
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    if not fields or any(field not in model.describe_fields for field in fields):
+        abort(422)
+    return fields
+
+
+# Filters of the list endpoints, each one builds the SQL predicate from the value of its query argument.
+# All of them but gender (too few distinct values to be worth one) are served by an index.
+ACTOR_FILTERS = {
+    'name': lambda value: Actor.name == value,
+    'gender': lambda value: Actor.gender == value,
+    'birth_date_from': lambda value: Actor.birth_date >= parse_date(value),
+    'birth_date_to': lambda value: Actor.birth_date <= parse_date(value),
+    # Ages are translated into birth date ranges, so they are served by the birth_date index as well
+    'age_min': lambda value: Actor.birth_date <= years_ago(int(value)),
+    'age_max': lambda value: Actor.birth_date > years_ago(int(value) + 1)
+}
+MOVIE_FILTERS = {
+    'title': lambda value: Movie.title == value,
+    'release_date_from': lambda value: Movie.release_date >= parse_date(value),
+    'release_date_to': lambda value: Movie.release_date <= parse_date(value)
+}
+
+
+# Sort orders of the list endpoints, as (column, descending) tuples
+ACTOR_SORTS = {
+    'age': (Actor.birth_date, True),
+    'appearance_count': (Actor.appearance_count, True)
+}
+MOVIE_SORTS = {
+    'cast_size': (Movie.cast_size, True)
+}
+
+
+def years_ago(years):
+    """
+    Returns the date (as a datetime) it was the given number of years ago, anyone born on or before it is at least
+    that old (see calculate_current_age).
+    """
+    today = date.today()
+    try:
+        day = today.replace(year=today.year - years)
+    except ValueError:
+        # February 29th of a non-leap year
+        day = today.replace(year=today.year - years, day=28)
+    return datetime(day.year, day.month, day.day)
+
+
+def apply_filters(query, filters):
+    """
+    Filters the query with the predicates of the filters found in the request arguments.
+    Aborts with a 422 if a filter value is not valid.
+    """
+    for argument, predicate in filters.items():
+        value = request.args.get(argument)
+        if value is None:
+            continue
+        try:
+            query = query.filter(predicate(value))
+        except (TypeError, ValueError):
+            abort(422)
+    return query
+
+
+# Streaming exports of the list endpoints
+STREAM_FORMATS = {'json': 'application/json', 'ndjson': 'application/x-ndjson'}
+STREAM_BATCH_SIZE = 1000
+
+
+def get_stream_format():
+    """
+    Reads the streaming format requested (?stream=json or ?stream=ndjson), None if the request is not a stream.
+    Aborts with a 422 if the format is not supported.
+    """
+    stream_format = request.args.get('stream')
+    if stream_format is not None and stream_format not in STREAM_FORMATS:
+        abort(422)
+    return stream_format
+
+
+def stream_collection(key, query, model, stream_format, fields=None, sort=None):
+    """
+    Streams every row of the query, described (restricted to the given fields), as a JSON document
+    ({"success": true, key: [...]}) or as newline delimited JSON (one row per line).
+    Rows are read and serialized in keyset batches (in the given sort order), so the worker memory stays flat
+    whatever the table size.
+    """
+
+    def generate():
+        if stream_format == 'json':
+            yield '{"success": true, "%s": [' % key
+        separator = ',' if stream_format == 'json' else '\n'
+        after = None
+        first = True
+        while True:
+            page, next_cursor = paginate(query, model, STREAM_BATCH_SIZE, after, sort)
+            after = decode_cursor(str(next_cursor), sort) if next_cursor is not None else None
+            chunk = separator.join(json.dumps(row.describe(fields)) for row in page)
+            if chunk:
+                if stream_format == 'json':
+                    yield chunk if first else ',' + chunk
+                else:
+                    yield chunk + '\n'
+                first = False
+            if after is None:
+                break
+        if stream_format == 'json':
+            yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_FORMATS[stream_format])
+
+
+def conditional(*table_names, daily=False):
+    """
+    Decorator adding a strong ETag, derived from the change versions of the given tables, to the responses of a
+    read endpoint. A request whose If-None-Match matches it gets a 304 without running the endpoint at all, and
+    the serialized bodies are kept in the response cache under the same versions, so a write invalidates them.
+    It must be applied after requires_auth, so the authorization is still enforced.
+    :param table_names: tables the representation is built from
+    :param daily: the representation also changes every day (i.e. it contains ages)
+    """
+
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # The versions are read before the data, so the ETag can be older than the body but never newer.
+            etag = '-'.join(str(version) for version in get_change_versions(*table_names))
+            if daily:
+                etag += '-' + date.today().isoformat()
+            if etag in request.if_none_match:
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            cache_key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            cached = response_cache.get(cache_key, etag)
+            if cached is not None:
+                body, mimetype = cached
+                response = Response(body, status=200, mimetype=mimetype)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    response_cache.set(cache_key, etag, response.get_data(), response.mimetype)
+
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+
+        return wrapper
+
+    return conditional_decorator
+
+
+# Bulk creation endpoints
+MAX_BATCH_SIZE = 1000
+
+
+def get_batch_body():
+    """
+    Reads the JSON array of objects sent to a bulk creation endpoint.
+    Aborts with a 422 if it is not a non-empty array of at most MAX_BATCH_SIZE items.
+    """
+    body = request.get_json()
+    if not isinstance(body, list) or not 0 < len(body) <= MAX_BATCH_SIZE:
+        abort(422)
+    return body
+
+
+def invalid_text_fields(item, columns):
+    """
+    Returns the names of the given String columns whose value in the item is not a string fitting the column.
+    """
+    return [column.key for column in columns
+            if not isinstance(item[column.key], str) or len(item[column.key]) > column.type.length]
+
+
+def is_id(value):
+    """
+    Tells whether a JSON value is an integer id: json also decodes floats, and bool is a subclass of int.
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def get_ids_filter(key):
+    """
+    Reads the optional JSON array of ids (e.g. movie_ids) restricting a bulk deletion.
+    Aborts with a 422 if it is not an array of at most MAX_BATCH_SIZE integers.
+    :return: list of ids, None if the deletion is not restricted
+    """
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        abort(422)
+    ids = body.get(key)
+    if ids is None:
+        return None
+    if not isinstance(ids, list) or len(ids) > MAX_BATCH_SIZE or \
+            not all(is_id(id) for id in ids):
+        abort(422)
+    return ids
+
+
+def batch_validation_error(errors):
+    """
+    Response listing the items of a bulk creation request that did not pass validation.
+    """
+    return jsonify({
+        "success": False,
+        "error": 422,
+        "message": "Unprocessable",
+        "errors": errors
+    }), 422
+
+
+# Batch endpoint
+MAX_BATCH_OPERATIONS = 50
+BATCH_METHODS = ('GET', 'POST', 'PATCH', 'DELETE')
+# Reference to (a value of) the response of a previous operation, i.e. $0.new_movie.id
+BATCH_REFERENCE = re.compile(r'\$(\d+)((?:\.\w+)+)')
+
+
+def get_batch_operations():
+    """
+    Reads the JSON array of operations sent to /batch, each one an object with a method, a path (with its query
+    string) and an optional body.
+    Aborts with a 422 if it is not a non-empty array of at most MAX_BATCH_OPERATIONS operations.
+    """
+    operations = request.get_json()
+    if not isinstance(operations, list) or not 0 < len(operations) <= MAX_BATCH_OPERATIONS:
+        abort(422)
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('method') not in BATCH_METHODS or \
+                not isinstance(operation.get('path'), str) or not operation['path'].startswith('/'):
+            abort(422)
+    return operations
+
+
+def resolve_references(value, results):
+    """
+    Replaces the strings of a body that are references to the responses of the previous operations of a batch
+    ('$<index>.<key>.<key>...') by the referenced values.
+    Raises a LookupError, TypeError or ValueError if a reference doesn't point to a value.
+    """
+
+    def lookup(match):
+        value = results[int(match.group(1))]
+        for key in match.group(2)[1:].split('.'):
+            value = value[int(key)] if isinstance(value, list) else value[key]
+        return value
+
+    if isinstance(value, str):
+        match = BATCH_REFERENCE.fullmatch(value)
+        return lookup(match) if match else value
+    if isinstance(value, list):
+        return [resolve_references(item, results) for item in value]
+    if isinstance(value, dict):
+        return {key: resolve_references(item, results) for key, item in value.items()}
+    return value
+
+
+def run_batch_operation(app, operation, payload, results):
+    """
+    Runs an operation of a batch with the handler of its endpoint, in a request context of its own.
+    The batch is authenticated once, so the handler is called past requires_auth, once its permission is checked
+    against the payload of the batch. It is called past conditional as well, as the response cache must never keep
+    a body built from writes that may still be rolled back.
+    Raises an HTTPException or an AuthError if the operation can't be run.
+    :return: the response of the handler
+    """
+    try:
+        path = BATCH_REFERENCE.sub(lambda match: str(resolve_references(match.group(0), results)), operation['path'])
+        body = resolve_references(operation.get('body'), results)
+    except (LookupError, TypeError, ValueError):
+        abort(422)
+
+    with app.request_context(EnvironBuilder(path=path, method=operation['method'], json=body).get_environ()):
+        if request.routing_exception is not None:
+            raise request.routing_exception
+        view = app.view_functions[request.url_rule.endpoint]
+        # Only the authenticated endpoints can be batched, and batches can't be nested
+        if not hasattr(view, 'permission') or request.url_rule.endpoint == 'post_batch':
+            abort(422)
+        if view.permission is not None:
+            for permission in [view.permission] if isinstance(view.permission, str) else view.permission:
+                check_permissions(permission, payload)
+        response = app.make_response(inspect.unwrap(view)(payload, **request.view_args))
+        if response.is_streamed:
+            response.close()
+            abort(422)
+        return response
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+# Search endpoint, per type of result: model, searched column, fields of the hits and permission required
+SEARCH_TYPES = {
+    'actors': (Actor, Actor.name, ['id', 'name'], 'get:actors-detail'),
+    'movies': (Movie, Movie.title, ['id', 'title'], 'get:movies-detail')
+}
+SEARCH_MIN_LENGTH = 3
+SEARCH_MAX_OFFSET = 1000
+
+
+def create_app(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config', 'dev_config.py')):
     # App Config
     app = Flask(__name__)
 
@@ -21,8 +428,29 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
             database_path = database_path.replace('postgres:', 'postgresql:')
         app.config["SQLALCHEMY_DATABASE_URI"] = database_path
 
+    # Read replicas, a comma separated list of database urls
+    replica_paths = os.environ.get('DATABASE_REPLICA_URLS')
+    if replica_paths:
+        app.config['SQLALCHEMY_REPLICA_URIS'] = [path.strip().replace('postgres:', 'postgresql:')
+                                                 for path in replica_paths.split(',') if path.strip()]
+
+    # Connection pool settings, the environment overrides the config file
+    for key, default in POOL_DEFAULTS.items():
+        value = os.environ.get(key)
+        if value is not None:
+            app.config[key] = value.lower() in ('1', 'true', 'yes') if isinstance(default, bool) else int(value)
+
+    # Opt-in request instrumentation
+    if 'INSTRUMENTATION' in os.environ:
+        app.config['INSTRUMENTATION'] = os.environ['INSTRUMENTATION'].lower() in ('1', 'true', 'yes')
+    if 'QUERY_BUDGET' in os.environ:
+        app.config['QUERY_BUDGET'] = int(os.environ['QUERY_BUDGET'])
+
     # Setup models
     setup_db(app)
+    if app.config.get('INSTRUMENTATION'):
+        setup_instrumentation(app)
+    setup_metrics(app)
 
     # CORS Headers
     CORS(app)
@@ -37,15 +465,34 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
     def hello():
         return 'Hello, World!'
 
+    @app.route('/health')
+    def health():
+        return jsonify({
+            "success": True,
+            "pool": pool_stats(),
+            "costar_index": costar_index.stats()
+        }), 200
+
     # ACTORS ENDPOINTS
     @app.route('/actors', methods=['GET'])
     @requires_auth('get:actors-detail')
+    @conditional('actors', 'appearances', 'movies', daily=True)
     def get_actors(payload):
+        fields = get_fields(Actor)
+        sort = get_sort(ACTOR_SORTS)
+        query = apply_filters(Actor.describe_query(fields), ACTOR_FILTERS)
+        stream_format = get_stream_format()
+        if stream_format:
+            return stream_collection('actors', query, Actor, stream_format, fields, sort)
+
+        limit, after = get_page_arguments(sort)
         try:
-            actors = [actor.describe() for actor in Actor.query.all()]
+            page, next_cursor = paginate(query, Actor, limit, after, sort)
+            actors = [actor.describe(fields) for actor in page]
             return jsonify({
                 "success": True,
-                "actors": actors
+                "actors": actors,
+                "next_cursor": next_cursor
             }), 200
         except BaseException:
             print(sys.exc_info())
@@ -74,6 +521,39 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
             print(sys.exc_info())
             abort(404)
 
+    @app.route('/actors/batch', methods=['POST'])
+    @requires_auth('post:actors')
+    def post_actors_batch(payload):
+        body = get_batch_body()
+        new_actors, errors = [], []
+        for index, item in enumerate(body):
+            if not isinstance(item, dict) or any((element not in item for element in ('name', 'gender', 'birth_date'))):
+                errors.append({'index': index, 'message': 'Missing name, gender or birth_date.'})
+                continue
+            invalid_fields = invalid_text_fields(item, (Actor.name, Actor.gender))
+            if invalid_fields:
+                errors.append({'index': index, 'message': 'Invalid {}.'.format(' and '.join(invalid_fields))})
+                continue
+            try:
+                birth_date = parse_date(item['birth_date'])
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'message': 'Invalid birth_date.'})
+                continue
+            new_actors.append(Actor(name=item['name'], gender=item['gender'], birth_date=birth_date, filmography=[]))
+
+        if errors:
+            return batch_validation_error(errors)
+
+        try:
+            return jsonify({
+                'success': True,
+                'new_actors': insert_all(new_actors)
+            }), 200
+
+        except BaseException:
+            print(sys.exc_info())
+            abort(422)
+
     @app.route('/actors/<id>', methods=['PATCH'])
     @requires_auth('patch:actors')
     def patch_actor_id(payload, id):
@@ -113,12 +593,23 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
     # MOVIES ENDPOINTS
     @app.route('/movies', methods=['GET'])
     @requires_auth('get:movies-detail')
+    @conditional('actors', 'appearances', 'movies')
     def get_movies(payload):
+        fields = get_fields(Movie)
+        sort = get_sort(MOVIE_SORTS)
+        query = apply_filters(Movie.describe_query(fields), MOVIE_FILTERS)
+        stream_format = get_stream_format()
+        if stream_format:
+            return stream_collection('movies', query, Movie, stream_format, fields, sort)
+
+        limit, after = get_page_arguments(sort)
         try:
-            movies = [movie.describe() for movie in Movie.query.all()]
+            page, next_cursor = paginate(query, Movie, limit, after, sort)
+            movies = [movie.describe(fields) for movie in page]
             return jsonify({
                 "success": True,
-                "movies": movies
+                "movies": movies,
+                "next_cursor": next_cursor
             }), 200
         except BaseException:
             print(sys.exc_info())
@@ -146,6 +637,38 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
             print(sys.exc_info())
             abort(404)
 
+    @app.route('/movies/batch', methods=['POST'])
+    @requires_auth('post:movies')
+    def post_movies_batch(payload):
+        body = get_batch_body()
+        new_movies, errors = [], []
+        for index, item in enumerate(body):
+            if not isinstance(item, dict) or any((element not in item for element in ('title', 'release_date'))):
+                errors.append({'index': index, 'message': 'Missing title or release_date.'})
+                continue
+            if invalid_text_fields(item, (Movie.title,)):
+                errors.append({'index': index, 'message': 'Invalid title.'})
+                continue
+            try:
+                release_date = parse_date(item['release_date'])
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'message': 'Invalid release_date.'})
+                continue
+            new_movies.append(Movie(title=item['title'], release_date=release_date, cast=[]))
+
+        if errors:
+            return batch_validation_error(errors)
+
+        try:
+            return jsonify({
+                'success': True,
+                'new_movies': insert_all(new_movies)
+            }), 200
+
+        except BaseException:
+            print(sys.exc_info())
+            abort(422)
+
     @app.route('/movies/<id>', methods=['PATCH'])
     @requires_auth('patch:movies')
     def patch_movie_id(payload, id):
@@ -205,6 +728,54 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
             print(sys.exc_info())
             abort(404)
 
+    @app.route('/appearances/batch', methods=['POST'])
+    @requires_auth('post:appearances')
+    def post_appearances_batch(payload):
+        body = get_batch_body()
+        pairs, errors = [], []
+        for index, item in enumerate(body):
+            try:
+                actor_id, movie_id = item['actor_id'], item['movie_id']
+            except (KeyError, TypeError):
+                actor_id = movie_id = None
+            if is_id(actor_id) and is_id(movie_id):
+                pairs.append((index, actor_id, movie_id))
+            else:
+                errors.append({'index': index, 'message': 'Missing or invalid actor_id or movie_id.'})
+
+        # Every referenced actor, movie and already existing appearance is looked up at once
+        actor_ids = {actor_id for _, actor_id, _ in pairs}
+        movie_ids = {movie_id for _, _, movie_id in pairs}
+        actors = {actor.id: actor for actor in Actor.query.filter(Actor.id.in_(actor_ids))}
+        movies = {movie.id: movie for movie in Movie.query.filter(Movie.id.in_(movie_ids))}
+        existing = {(appearance.actor_id, appearance.movie_id) for appearance in
+                    Appearance.query.filter(tuple_(Appearance.actor_id, Appearance.movie_id)
+                                            .in_([(actor_id, movie_id) for _, actor_id, movie_id in pairs]))}
+
+        new_appearances = []
+        for index, actor_id, movie_id in pairs:
+            if actor_id not in actors or movie_id not in movies:
+                errors.append({'index': index, 'message': 'Actor or movie not found.'})
+            elif (actor_id, movie_id) in existing:
+                errors.append({'index': index, 'message': 'Appearance already exists.'})
+            else:
+                existing.add((actor_id, movie_id))
+                new_appearances.append(Appearance(actors=actors[actor_id], movies=movies[movie_id]))
+
+        if errors:
+            return batch_validation_error(sorted(errors, key=lambda error: error['index']))
+
+        try:
+            new_appearances = insert_all(new_appearances)
+            return jsonify({
+                'success': True,
+                'new_appearances': new_appearances
+            }), 200
+
+        except BaseException:
+            print(sys.exc_info())
+            abort(422)
+
     @app.route('/appearances', methods=['DELETE'])
     @requires_auth('delete:appearances')
     def delete_appearance(payload):
@@ -213,10 +784,11 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
             if any((element not in body for element in ('actor_id', 'movie_id'))):
                 abort(422)
 
-            Appearance.query \
-                .filter(Appearance.actor_id == body['actor_id'] and Appearance.movie_id == body['movie_id']) \
-                .first() \
-                .delete()
+            # Looked up by primary key, from the identity map if already loaded
+            appearance = Appearance.query.get((body['actor_id'], body['movie_id']))
+            if appearance is None:
+                abort(404)
+            appearance.delete()
 
             return jsonify({
                 "success": True,
@@ -226,6 +798,174 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
         except BaseException:
             abort(404)
 
+    @app.route('/actors/<int:actor_id>/appearances', methods=['DELETE'])
+    @requires_auth('delete:appearances')
+    def delete_actor_appearances(payload, actor_id):
+        movie_ids = get_ids_filter('movie_ids')
+        if Actor.query.options(load_only('id')).get(actor_id) is None:
+            abort(404)
+        criteria = [Appearance.actor_id == actor_id]
+        if movie_ids is not None:
+            criteria.append(Appearance.movie_id.in_(movie_ids))
+        try:
+            removed = Appearance.delete_where(*criteria)
+            return jsonify({
+                "success": True,
+                "actor_id": actor_id,
+                "deleted": len(removed)
+            }), 200
+        except BaseException:
+            print(sys.exc_info())
+            abort(422)
+
+    @app.route('/movies/<int:movie_id>/cast', methods=['DELETE'])
+    @requires_auth('delete:appearances')
+    def delete_movie_cast(payload, movie_id):
+        actor_ids = get_ids_filter('actor_ids')
+        if Movie.query.options(load_only('id')).get(movie_id) is None:
+            abort(404)
+        criteria = [Appearance.movie_id == movie_id]
+        if actor_ids is not None:
+            criteria.append(Appearance.actor_id.in_(actor_ids))
+        try:
+            removed = Appearance.delete_where(*criteria)
+            return jsonify({
+                "success": True,
+                "movie_id": movie_id,
+                "deleted": len(removed)
+            }), 200
+        except BaseException:
+            print(sys.exc_info())
+            abort(422)
+
+    # CO-STAR GRAPH ENDPOINTS
+    @app.route('/actors/<int:actor_id>/co-stars', methods=['GET'])
+    @requires_auth('get:actors-detail')
+    @conditional('actors', 'appearances')
+    def get_co_stars(payload, actor_id):
+        try:
+            limit = int(request.args.get('limit', PAGE_SIZE))
+        except ValueError:
+            abort(422)
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            abort(422)
+        if Actor.query.options(load_only('id')).get(actor_id) is None:
+            abort(404)
+
+        try:
+            costar_index.refresh()
+            counts = costar_index.co_stars(actor_id)
+            # Most shared movies first
+            top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            actors = {actor.id: actor for actor in
+                      Actor.query.options(load_only('id', 'name')).filter(Actor.id.in_([co_star_id for co_star_id, _ in top]))}
+            return jsonify({
+                "success": True,
+                "actor_id": actor_id,
+                "total": len(counts),
+                "co_stars": [dict(actors[co_star_id].describe(['id', 'name']), shared_movies=shared)
+                             for co_star_id, shared in top if co_star_id in actors]
+            }), 200
+        except BaseException:
+            print(sys.exc_info())
+            abort(404)
+
+    @app.route('/actors/<int:actor_id>/path/<int:other_id>', methods=['GET'])
+    # The path goes through movies
+    @requires_auth(['get:actors-detail', 'get:movies-detail'])
+    @conditional('actors', 'appearances', 'movies')
+    def get_path(payload, actor_id, other_id):
+        if Actor.query.filter(Actor.id.in_({actor_id, other_id})).count() != len({actor_id, other_id}):
+            abort(404)
+
+        costar_index.refresh()
+        path = costar_index.shortest_path(actor_id, other_id, MAX_DEGREES)
+        # Not connected within MAX_DEGREES
+        if path is None:
+            abort(404)
+
+        try:
+            actor_ids, movie_ids = path
+            actors = {actor.id: actor for actor in
+                      Actor.query.options(load_only('id', 'name')).filter(Actor.id.in_(actor_ids))}
+            movies = {movie.id: movie for movie in
+                      Movie.query.options(load_only('id', 'title')).filter(Movie.id.in_(movie_ids))}
+            return jsonify({
+                "success": True,
+                "degrees": len(movie_ids),
+                "actors": [actors[path_actor_id].describe(['id', 'name']) for path_actor_id in actor_ids],
+                "movies": [movies[path_movie_id].describe(['id', 'title']) for path_movie_id in movie_ids]
+            }), 200
+        except BaseException:
+            print(sys.exc_info())
+            abort(404)
+
+    # BATCH ENDPOINT
+    @app.route('/batch', methods=['POST'])
+    @requires_auth(None)
+    def post_batch(payload):
+        operations = get_batch_operations()
+        results = []
+        # The operations read the writes of the previous ones, so the whole batch runs on the primary
+        db.session.info['wrote'] = True
+        try:
+            for index, operation in enumerate(operations):
+                # Each operation runs in a SAVEPOINT, which the commit of its handler only releases: nothing is
+                # committed until the whole batch succeeded
+                savepoint = db.session.begin_nested()
+                # Releasing a SAVEPOINT doesn't expire the models, which the database (i.e. triggers) may have changed
+                db.session.expire_all()
+                try:
+                    response = run_batch_operation(app, operation, payload, results)
+                except (HTTPException, AuthError) as error:
+                    response = app.make_response(app.handle_user_exception(error))
+
+                if response.status_code >= 400:
+                    db.session.rollback()
+                    return jsonify(dict(response.get_json() or {}, success=False, index=index)), response.status_code
+
+                results.append(response.get_json())
+                if savepoint.is_active:
+                    # A read-only operation doesn't commit its SAVEPOINT itself
+                    savepoint.commit()
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+
+        return jsonify({
+            "success": True,
+            "results": results
+        }), 200
+
+    # SEARCH ENDPOINT
+    @app.route('/search', methods=['GET'])
+    @requires_auth(None)
+    def search(payload):
+        text = request.args.get('q', '').strip()
+        types = request.args.get('type', ','.join(SEARCH_TYPES)).split(',')
+        try:
+            limit = int(request.args.get('limit', PAGE_SIZE))
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            abort(422)
+        if len(text) < SEARCH_MIN_LENGTH or any(search_type not in SEARCH_TYPES for search_type in types) \
+                or not 0 < limit <= MAX_PAGE_SIZE or not 0 <= offset <= SEARCH_MAX_OFFSET:
+            abort(422)
+        for search_type in types:
+            check_permissions(SEARCH_TYPES[search_type][3], payload)
+
+        try:
+            results = {"success": True}
+            for search_type in types:
+                model, column, fields, _ = SEARCH_TYPES[search_type]
+                hits = search_query(model, column, text).options(load_only(*fields)).limit(limit).offset(offset)
+                results[search_type] = [hit.describe(fields) for hit in hits]
+            return jsonify(results), 200
+        except BaseException:
+            print(sys.exc_info())
+            abort(404)
+
     # Error Handling
     @app.errorhandler(AuthError)
     def auth_error(error):
@@ -278,7 +1018,7 @@ def create_app(config_file=os.path.join(os.getcwd(), 'config', 'dev_config.py'))
     return app
 
 
-app = create_app()
-
+# The app is only created by the entry points (gunicorn 'app:create_app()', manage.py, asgi.py, flask run),
+# so importing this module has no side effects.
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    create_app().run()
\ No newline at end of file
@@ -0,0 +1,25 @@
+"""
+ASGI entry point of the app, to serve it from an event loop instead of a pool of WSGI workers:
+    uvicorn asgi:app
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+
+Connections, including slow clients, are held by the event loop, and the Flask routes run in a thread pool.
+The pool has as many threads as database connections a worker can open, so requests never queue on the
+connection pool while holding a thread.
+"""
+from a2wsgi import WSGIMiddleware
+
+from app import create_app
+
+
+
+def create_asgi_app(wsgi_app):
+    """
+    create_asgi_app(wsgi_app)
+        wraps the Flask app into an ASGI app, running its routes in a thread pool sized after its connection pool
+    """
+    return WSGIMiddleware(wsgi_app, workers=wsgi_app.config['DB_POOL_SIZE'] + wsgi_app.config['DB_MAX_OVERFLOW'])
+
+
+wsgi_app = create_app()
+app = create_asgi_app(wsgi_app)
@@ -1,21 +1,65 @@
 import configparser
+import hashlib
 import json
-from functools import wraps
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
 from urllib.request import urlopen
 
-from flask import request
+from flask import g, request
 from jose import jwt
-import os
-
-config = configparser.ConfigParser()
-config_file = os.path.join(os.getcwd(), 'auth', 'secrets.cfg')
 
-config.read(config_file)
-AUTH0_DOMAIN = config['AUTH0']['AUTH0_DOMAIN']
-API_AUDIENCE = config['AUTH0']['API_AUDIENCE']
+# secrets.cfg is found next to this module, whatever the working directory, and only read the first time a setting
+# is needed, so importing the app has no side effects. Every setting can be overridden by an environment variable.
+SECRETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'secrets.cfg')
 ALGORITHMS = ['RS256']
 
 
+@lru_cache(maxsize=None)
+def read_secrets():
+    config = configparser.ConfigParser()
+    config.read(SECRETS_FILE)
+    return dict(config['AUTH0']) if config.has_section('AUTH0') else {}
+
+
+def get_setting(name, default=None):
+    """
+    Returns an Auth0 setting (AUTH0_DOMAIN, API_AUDIENCE) from the environment or the AUTH0 section of
+    secrets.cfg, or the default. Raises an AuthError if the setting is missing.
+    """
+    value = os.environ.get(name) or read_secrets().get(name.lower(), default)
+    if value is None:
+        raise AuthError({
+            'code': 'invalid_configuration',
+            'description': f'{name} is not configured.'
+        }, 500)
+    return value
+
+
+def get_jwks_url():
+    # Auth0 exposes a JWKS endpoint for each tenant, which is found at https://YOUR_DOMAIN/.well-known/jwks.json.
+    # It can be overridden (e.g. with a file:// url or a local stub server) through the environment or secrets.cfg.
+    url = os.environ.get('JWKS_URL') or read_secrets().get('jwks_url')
+    return url or f"https://{get_setting('AUTH0_DOMAIN')}/.well-known/jwks.json"
+
+
+# Seconds the key set is considered fresh when the response carries no usable Cache-Control max-age.
+JWKS_DEFAULT_TTL = 600
+# Seconds an expired key set may still be served while it is refreshed in the background.
+JWKS_MAX_STALE = 24 * 60 * 60
+# Minimum seconds between two forced refreshes triggered by unknown key ids.
+JWKS_REFRESH_COOLDOWN = 30
+# Maximum number of verified tokens kept in memory, and maximum seconds a verified token is trusted without
+# checking its signature again (it is never trusted past its exp claim).
+TOKEN_CACHE_MAX_ENTRIES = 10000
+TOKEN_CACHE_MAX_TTL = 300
+# Tokens larger than this (in bytes) are never cached.
+TOKEN_CACHE_MAX_TOKEN_SIZE = 8192
+
+
 class AuthError(Exception):
     """
     AuthError Exception
@@ -27,6 +71,223 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+class JWKSKeyStore:
+    """
+    JWKSKeyStore
+    A process-wide, thread safe cache of the JSON Web Key Set used to verify tokens.
+    - The key set is kept for the max-age advertised by the Cache-Control header (or a default ttl).
+    - Once expired, the stale key set keeps being served while a background thread revalidates it.
+    - An unknown kid forces a synchronous refresh, at most once per cooldown period.
+    - One thread fetches at a time, the others waiting for the key set reuse the outcome of its fetch. After a failed
+      fetch, the requests fail fast for a cooldown period rather than each waiting for the timeout again.
+    """
+
+    def __init__(self, url=None, default_ttl=JWKS_DEFAULT_TTL, max_stale=JWKS_MAX_STALE,
+                 refresh_cooldown=JWKS_REFRESH_COOLDOWN, timeout=5):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+        self.refresh_cooldown = refresh_cooldown
+        self.timeout = timeout
+        self._keys = None
+        self._expires_at = 0
+        self._last_fetch = None
+        self._failed_at = None
+        self._fetches = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._fetching = threading.Lock()
+
+    def _max_age(self, cache_control):
+        """
+        Returns the max-age (in seconds) of a Cache-Control header, or the default ttl if there is none.
+        """
+        if not cache_control:
+            return self.default_ttl
+        if re.search(r'\bno-(store|cache)\b', cache_control):
+            return 0
+        match = re.search(r'\bmax-age\s*=\s*"?(\d+)', cache_control)
+        return int(match.group(1)) if match else self.default_ttl
+
+    def _fetch(self, seen_fetches=None):
+        """
+        Downloads the key set and stores it, returns True on success.
+        A failed download keeps the previous key set (if any) in place.
+        :param seen_fetches: number of fetches done when the caller found it needed one: if another fetch completed
+        since (i.e. while the caller was waiting for it), its outcome is reused instead of fetching again
+        """
+        with self._fetching:
+            with self._lock:
+                if seen_fetches is not None and self._fetches != seen_fetches:
+                    return self._failed_at is None
+                self._last_fetch = time.monotonic()
+            url = self.url
+            try:
+                url = url or get_jwks_url()
+                with urlopen(url, timeout=self.timeout) as response:
+                    jwks = json.loads(response.read())
+                    max_age = self._max_age(response.headers.get('Cache-Control'))
+                keys = {key['kid']: key for key in jwks['keys'] if 'kid' in key}
+            except Exception as error:
+                print(f'Unable to fetch JWKS from {url}: {error!r}')
+                with self._lock:
+                    self._failed_at = time.monotonic()
+                    self._fetches += 1
+                return False
+
+            with self._lock:
+                self._keys = keys
+                self._expires_at = time.monotonic() + max_age
+                self._failed_at = None
+                self._fetches += 1
+            return True
+
+    def _revalidate(self):
+        try:
+            self._fetch()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _revalidate_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._revalidate, daemon=True).start()
+
+    def get_key(self, kid):
+        """
+        :param kid: key id found in the token header
+        :return: the matching JWK (dict) or None if the key set does not contain it
+        Raises an AuthError if no key set could ever be fetched.
+        """
+        now = time.monotonic()
+        with self._lock:
+            keys = self._keys
+            expires_at = self._expires_at
+            last_fetch = self._last_fetch
+            failed_at = self._failed_at
+            fetches = self._fetches
+
+        if keys is None or now > expires_at + self.max_stale:
+            # Nothing usable in cache, the request has to wait for the key set, unless it just failed to be fetched.
+            if failed_at is None or now - failed_at >= self.refresh_cooldown:
+                self._fetch(fetches)
+        elif kid not in keys and (last_fetch is None or now - last_fetch >= self.refresh_cooldown):
+            # Probably a key rotation, but rate limited so bogus kids can't trigger a fetch storm.
+            self._fetch(fetches)
+        elif now > expires_at:
+            # Stale while revalidate, answer with what we have and refresh in the background.
+            self._revalidate_in_background()
+
+        with self._lock:
+            keys = self._keys
+
+        if keys is None:
+            raise AuthError({
+                'code': 'jwks_unavailable',
+                'description': 'Unable to fetch the signing keys.'
+            }, 503)
+        return keys.get(kid)
+
+    def warm(self):
+        """
+        Fetches the key set ahead of the first request (e.g. in the gunicorn master, before forking the workers).
+        A failure is left to be retried by the first request.
+        """
+        return self._fetch()
+
+    def clear(self):
+        """
+        Drops the cached key set, the next lookup fetches it again.
+        """
+        with self._lock:
+            self._keys = None
+            self._expires_at = 0
+            self._last_fetch = None
+            self._failed_at = None
+
+
+# The url is resolved on the first fetch, unless given
+jwks_store = JWKSKeyStore()
+
+
+class VerifiedTokenCache:
+    """
+    VerifiedTokenCache
+    A bounded, thread safe LRU cache of already verified token payloads, keyed by the token SHA-256 digest.
+    Entries expire at the token exp claim (or after max_ttl seconds, whichever comes first).
+    """
+
+    def __init__(self, max_entries=TOKEN_CACHE_MAX_ENTRIES, max_ttl=TOKEN_CACHE_MAX_TTL,
+                 max_token_size=TOKEN_CACHE_MAX_TOKEN_SIZE):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.max_token_size = max_token_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        """
+        :param token: a json web token (string)
+        :return: the cached payload or None if the token has not been verified recently
+        """
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if time.time() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def set(self, token, payload):
+        """
+        Stores the payload of a verified token, tokens without an exp claim or too large are not cached.
+        """
+        if len(token) > self.max_token_size or not isinstance(payload.get('exp'), (int, float)):
+            return
+        expires_at = min(payload['exp'], time.time() + self.max_ttl)
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (expires_at, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+token_cache = VerifiedTokenCache()
+
+
 def get_token_auth_header():
     """
     Gets the header from the request and returns the JWT token part of the header.
@@ -79,13 +340,18 @@ def verify_decode_jwt(token):
     :param token: a json web token (string)
     :return:
     """
-    # Auth0 exposes a JWKS endpoint for each tenant, which is found at https://YOUR_DOMAIN/.well-known/jwks.json.
-    # This endpoint will contain the JWK used to sign all Auth0-issued JWTs for this tenant.
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+    # Tokens are reused for hours, skip the signature verification if this one was verified recently.
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
 
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
 
     if 'kid' not in unverified_header:
         raise AuthError({
@@ -93,67 +359,79 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        # Validate the claims
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    # The signing keys come from the process-wide JWKS store instead of a fresh download per request.
+    key = jwks_store.get_key(unverified_header['kid'])
+    if not key:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to find the appropriate key.'
+        }, 400)
 
-        if rsa_key:
-            try:
-                payload = jwt.decode(
-                    token,  # Decode the payload from the token
-                    rsa_key,
-                    algorithms=ALGORITHMS,
-                    audience=API_AUDIENCE,
-                    issuer='https://' + AUTH0_DOMAIN + '/'
-                )
-                # Return the decoded payload
-                return payload
-
-            except jwt.ExpiredSignatureError:
-                raise AuthError({
-                    'code': 'token_expired',
-                    'description': 'Token expired.'
-                }, 401)
-
-            except jwt.JWTClaimsError:
-                raise AuthError({
-                    'code': 'invalid_claims',
-                    'description': 'Incorrect claims. Please, check the audience and issuer.'
-                }, 401)
-
-            except Exception:
-                raise AuthError({
-                    'code': 'invalid_header',
-                    'description': 'Unable to parse authentication token.'
-                }, 400)
+    rsa_key = {
+        'kty': key['kty'],
+        'kid': key['kid'],
+        'use': key['use'],
+        'n': key['n'],
+        'e': key['e']
+    }
+
+    try:
+        payload = jwt.decode(
+            token,  # Decode the payload from the token
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=get_setting('API_AUDIENCE'),
+            issuer='https://' + get_setting('AUTH0_DOMAIN') + '/'
+        )
+        token_cache.set(token, payload)
+        # Return the decoded payload
+        return payload
 
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience and issuer.'
+        }, 401)
+
+    except Exception:
         raise AuthError({
             'code': 'invalid_header',
-            'description': 'Unable to find the appropriate key.'
+            'description': 'Unable to parse authentication token.'
         }, 400)
 
 
 def requires_auth(permission=''):
     """
-    :param permission: string permission (i.e. 'post:drink')
+    :param permission: string permission (i.e. 'post:drink'), list of permissions that are all required, or None to
+    only authenticate the request and leave the permission checks to the endpoint (i.e. when they depend on the
+    request arguments). Endpoints with a cached representation (see conditional) must not check permissions
+    themselves, as cached responses are served without running them.
     :return:
     """
 
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            start = time.perf_counter()
+            try:
+                token = get_token_auth_header()
+                payload = verify_decode_jwt(token)
+                if permission is not None:
+                    for required in [permission] if isinstance(permission, str) else permission:
+                        check_permissions(required, payload)
+            finally:
+                # Reported by the request instrumentation
+                g.auth_time = time.perf_counter() - start
             return f(payload, *args, **kwargs)
 
+        # Read by the /batch endpoint, which authenticates once and checks the permission of each operation itself
+        wrapper.permission = permission
         return wrapper
 
     return requires_auth_decorator
@@ -0,0 +1,508 @@
+"""
+Load benchmark of the API.
+
+Boots the app against a local database seeded with --size actors, movies and appearances, signs its own tokens with
+a local RSA key (served to the app as a stub JWKS through a file:// url), then drives every endpoint with
+--concurrency clients and reports the throughput and latency percentiles of each one.
+
+    python -m benchmarks.benchmark --size 100000 --concurrency 16 --output results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.benchmark --size 100000 --concurrency 16 --compare results/abc1234.json
+
+Must be run from the root of the project, like the app.
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+import rsa
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from generator.generator import FIRST_NAMES, LAST_NAMES, TITLE_WORDS, generate_catalog
+
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+# Cold start of a process (importing the app, creating it and answering a first request), flagged when it misses the
+# target. Measured in fresh interpreters, the median of a few runs is kept.
+COLD_START_TARGET_MS = 1000
+COLD_START_RUNS = 3
+COLD_START_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+app.test_client().get('/health')
+answered = time.perf_counter()
+print(json.dumps({'import': imported - start, 'create_app': created - imported, 'first_request': answered - created}))
+'''
+KEY_ID = 'benchmark'
+# Items of each request of the batch scenarios
+BATCH_SIZE = 10
+PERMISSIONS = ['get:actors-detail', 'get:movies-detail', 'post:actors', 'post:movies', 'patch:actors', 'patch:movies',
+               'delete:actors', 'delete:movies', 'post:appearances', 'delete:appearances']
+
+# SETUP
+
+def work_files(work_dir):
+    """
+    Creates (or reuses) the RSA key of the benchmark and writes the JWKS document serving its public part.
+    :return: (private key, jwks url) tuple
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    key_file = os.path.join(work_dir, 'key.pem')
+    if not os.path.exists(key_file):
+        _, private_key = rsa.newkeys(2048)
+        with open(key_file, 'wb') as f:
+            f.write(private_key.save_pkcs1())
+    with open(key_file, 'rb') as f:
+        private_key = rsa.PrivateKey.load_pkcs1(f.read())
+
+    def b64(number):
+        return base64.urlsafe_b64encode(number.to_bytes((number.bit_length() + 7) // 8, 'big')).rstrip(b'=').decode()
+
+    jwks_file = os.path.abspath(os.path.join(work_dir, 'jwks.json'))
+    with open(jwks_file, 'w') as f:
+        json.dump({'keys': [{'kid': KEY_ID, 'kty': 'RSA', 'use': 'sig', 'alg': 'RS256',
+                             'n': b64(private_key.n), 'e': b64(private_key.e)}]}, f)
+    return private_key, 'file://' + jwks_file
+
+
+def sign_token(private_key, permissions=PERMISSIONS, expires_in=24 * 3600):
+    from jose import jwt
+    from auth.auth import get_setting
+
+    claims = {'iss': f"https://{get_setting('AUTH0_DOMAIN')}/", 'aud': get_setting('API_AUDIENCE'),
+              'sub': 'benchmark|1', 'exp': int(time.time()) + expires_in, 'permissions': permissions}
+    return jwt.encode(claims, private_key.save_pkcs1().decode(), algorithm='RS256', headers={'kid': KEY_ID})
+
+
+def setup(args):
+    """
+    Points the app to the benchmark database and JWKS, seeds the database if it is empty and boots the app.
+    :return: (app, token) tuple
+    """
+    private_key, jwks_url = work_files(args.work_dir)
+    database_url = args.database_url or 'sqlite:///' + os.path.abspath(
+        os.path.join(args.work_dir, f'benchmark-{args.size}.db'))
+    os.environ['JWKS_URL'] = jwks_url
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['INSTRUMENTATION'] = '0'
+
+    from app import create_app
+    from models.models import Actor, db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if Actor.query.count() == 0:
+            start = time.perf_counter()
+            generate_catalog(db.engine, actors=args.size, movies=args.size, appearances=args.size, seed=args.seed)
+            print(f'Seeded in {time.perf_counter() - start:.1f}s')
+    return app, sign_token(private_key)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    # Keep-alive connections, so the clients don't run out of ports
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve(app):
+    """
+    Serves the app on a random local port from a background thread.
+    :return: base url of the server
+    """
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def measure_cold_start(runs=COLD_START_RUNS):
+    """
+    Times the import of the app, its creation and its first request in fresh interpreters, with the environment of
+    the benchmark.
+    :return: median milliseconds of each phase and of the total
+    """
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', COLD_START_SCRIPT], env=os.environ,
+                                         stderr=subprocess.DEVNULL)
+        sample = json.loads(output.decode().strip().splitlines()[-1])
+        sample['total'] = sum(sample.values())
+        samples.append(sample)
+    cold_start = {phase: round(sorted(sample[phase] for sample in samples)[len(samples) // 2] * 1000, 1)
+                  for phase in samples[0]}
+    cold_start['target'] = COLD_START_TARGET_MS
+    cold_start['met'] = cold_start['total'] <= COLD_START_TARGET_MS
+    return cold_start
+
+
+# SCENARIOS
+# Each scenario returns the (method, path, body, on_success) of its next request, or None when it has nothing left to
+# do. The state keeps the ids of the models created by the benchmark, so they are deleted again afterwards and the
+# database is left as it was.
+
+class State:
+    def __init__(self, size):
+        self.size = size
+        self.actors = deque()
+        self.movies = deque()
+        self.appearances = deque()
+
+
+def random_date(rng):
+    return (datetime(1940, 1, 1) + timedelta(days=rng.randrange(80 * 365))).strftime('%Y-%m-%d')
+
+
+def pop(queue):
+    try:
+        return queue.popleft()
+    except IndexError:
+        return None
+
+
+def index(rng, state):
+    return 'GET', '/', None, None
+
+
+def health(rng, state):
+    return 'GET', '/health', None, None
+
+
+def metrics(rng, state):
+    return 'GET', '/metrics', None, None
+
+
+def get_actors_first_page(rng, state):
+    return 'GET', '/actors', None, None
+
+
+def get_actors_page(rng, state):
+    return 'GET', '/actors?' + urlencode({'limit': 50, 'after': rng.randint(1, state.size)}), None, None
+
+
+def get_actors_filtered(rng, state):
+    arguments = {'name': rng.choice(LAST_NAMES), 'age_min': rng.randint(20, 60), 'sort': '-age',
+                 'fields': 'id,name,age'}
+    return 'GET', '/actors?' + urlencode(arguments), None, None
+
+
+def get_popular_actors(rng, state):
+    arguments = {'sort': 'appearance_count', 'limit': 20, 'fields': 'id,name,appearance_count,last_release_year'}
+    return 'GET', '/actors?' + urlencode(arguments), None, None
+
+
+def get_movies_page(rng, state):
+    return 'GET', '/movies?' + urlencode({'limit': 50, 'after': rng.randint(1, state.size)}), None, None
+
+
+def stream_movies(rng, state):
+    arguments = {'stream': 'ndjson', 'fields': 'id,title',
+                 'title': f'{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)}'}
+    return 'GET', '/movies?' + urlencode(arguments), None, None
+
+
+def search(rng, state):
+    return 'GET', '/search?' + urlencode({'q': rng.choice(LAST_NAMES + TITLE_WORDS)[:4], 'limit': 20}), None, None
+
+
+def get_co_stars(rng, state):
+    return 'GET', f'/actors/{rng.randint(1, state.size)}/co-stars?limit=20', None, None
+
+
+def get_path(rng, state):
+    return 'GET', f'/actors/{rng.randint(1, state.size)}/path/{rng.randint(1, state.size)}', None, None
+
+
+def post_actor(rng, state):
+    body = {'name': f'{rng.choice(FIRST_NAMES)} Benchmark', 'gender': rng.choice('MF'), 'birth_date': random_date(rng)}
+    return 'POST', '/actors', body, lambda data: state.actors.append(data['new_actor']['id'])
+
+
+def post_movie(rng, state):
+    body = {'title': f'{rng.choice(TITLE_WORDS)} Benchmark', 'release_date': random_date(rng)}
+    return 'POST', '/movies', body, lambda data: state.movies.append(data['new_movie']['id'])
+
+
+def post_actors_batch(rng, state):
+    body = [{'name': f'{rng.choice(FIRST_NAMES)} Benchmark', 'gender': rng.choice('MF'),
+             'birth_date': random_date(rng)} for _ in range(BATCH_SIZE)]
+    return 'POST', '/actors/batch', body, lambda data: state.actors.extend(
+        actor['id'] for actor in data['new_actors'])
+
+
+def post_movies_batch(rng, state):
+    body = [{'title': f'{rng.choice(TITLE_WORDS)} Benchmark', 'release_date': random_date(rng)}
+            for _ in range(BATCH_SIZE)]
+    return 'POST', '/movies/batch', body, lambda data: state.movies.extend(
+        movie['id'] for movie in data['new_movies'])
+
+
+def patch_actor(rng, state):
+    if state.actors:
+        return 'PATCH', f'/actors/{rng.choice(state.actors)}', {'name': f'{rng.choice(FIRST_NAMES)} Patched'}, None
+
+
+def patch_movie(rng, state):
+    if state.movies:
+        return 'PATCH', f'/movies/{rng.choice(state.movies)}', {'title': f'{rng.choice(TITLE_WORDS)} Patched'}, None
+
+
+def post_appearance(rng, state):
+    # Every created actor appears once, so no appearance is posted twice
+    actor_id = pop(state.actors)
+    if actor_id is not None and state.movies:
+        body = {'actor_id': actor_id, 'movie_id': rng.choice(state.movies)}
+        return 'POST', '/appearances', body, lambda data: state.appearances.append((actor_id, body['movie_id']))
+
+
+def delete_appearance(rng, state):
+    pair = pop(state.appearances)
+    if pair is not None:
+        body = {'actor_id': pair[0], 'movie_id': pair[1]}
+        return 'DELETE', '/appearances', body, lambda data: state.actors.append(pair[0])
+
+
+def post_appearances_batch(rng, state):
+    # Like post_appearance, every created actor appears once
+    actor_ids = [actor_id for actor_id in (pop(state.actors) for _ in range(BATCH_SIZE)) if actor_id is not None]
+    if actor_ids and state.movies:
+        pairs = [(actor_id, rng.choice(state.movies)) for actor_id in actor_ids]
+        body = [{'actor_id': actor_id, 'movie_id': movie_id} for actor_id, movie_id in pairs]
+        return 'POST', '/appearances/batch', body, lambda data: state.appearances.extend(pairs)
+
+
+def delete_actor_appearances(rng, state):
+    # The actor only appears in this movie, so all of its appearances are the one of the pair
+    pair = pop(state.appearances)
+    if pair is not None:
+        return 'DELETE', f'/actors/{pair[0]}/appearances', None, lambda data: state.actors.append(pair[0])
+
+
+def delete_movie_cast(rng, state):
+    pair = pop(state.appearances)
+    if pair is not None:
+        body = {'actor_ids': [pair[0]]}
+        return 'DELETE', f'/movies/{pair[1]}/cast', body, lambda data: state.actors.append(pair[0])
+
+
+def post_batch(rng, state):
+    # What the casting UI does on one action: a movie, its cast, and a read of the result, in one round trip
+    cast_size = 3
+    operations = [{'method': 'POST', 'path': '/movies',
+                   'body': {'title': f'{rng.choice(TITLE_WORDS)} Batch', 'release_date': random_date(rng)}}]
+    operations += [{'method': 'POST', 'path': '/actors',
+                    'body': {'name': f'{rng.choice(FIRST_NAMES)} Batch', 'gender': rng.choice('MF'),
+                             'birth_date': random_date(rng)}} for _ in range(cast_size)]
+    operations += [{'method': 'POST', 'path': '/appearances',
+                    'body': {'actor_id': f'${index}.new_actor.id', 'movie_id': '$0.new_movie.id'}}
+                   for index in range(1, cast_size + 1)]
+    operations.append({'method': 'GET', 'path': '/actors/$1.new_actor.id/co-stars'})
+
+    def on_success(data):
+        state.movies.append(data['results'][0]['new_movie']['id'])
+        state.actors.extend(result['new_actor']['id'] for result in data['results'][1:cast_size + 1])
+
+    return 'POST', '/batch', operations, on_success
+
+
+def delete_actor(rng, state):
+    actor_id = pop(state.actors)
+    if actor_id is not None:
+        return 'DELETE', f'/actors/{actor_id}', None, None
+
+
+def delete_movie(rng, state):
+    movie_id = pop(state.movies)
+    if movie_id is not None:
+        return 'DELETE', f'/movies/{movie_id}', None, None
+
+
+# Run in this order, the writes creating what the following ones update and delete
+SCENARIOS = [index, health, metrics, get_actors_first_page, get_actors_page, get_actors_filtered, get_popular_actors,
+             get_movies_page, stream_movies, search, get_co_stars, get_path, post_actor, post_movie, post_actors_batch,
+             post_movies_batch, patch_actor, patch_movie, post_appearance, delete_appearance, post_appearances_batch,
+             delete_actor_appearances, delete_movie_cast, post_batch, delete_actor, delete_movie]
+
+
+# RUNNER
+
+def percentile(latencies, p):
+    """Nearest-rank percentile of the sorted latencies."""
+    if not latencies:
+        return None
+    return latencies[min(len(latencies) - 1, max(0, int(round(p / 100 * len(latencies))) - 1))]
+
+
+def run_scenario(scenario, base_url, token, state, requests, concurrency, seed_value):
+    """
+    Sends up to the given number of requests of the scenario from concurrency threads, each with its own
+    keep-alive connection.
+    :return: summary of the latencies and status codes
+    """
+    url = urlsplit(base_url)
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    remaining = [requests]
+    lock = threading.Lock()
+    latencies, statuses = [], Counter()
+
+    def worker(number):
+        rng = random.Random(f'{seed_value}-{scenario.__name__}-{number}')
+        connection = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    break
+                remaining[0] -= 1
+                next_request = scenario(rng, state)
+            if next_request is None:
+                break
+            method, path, body, on_success = next_request
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, body=json.dumps(body) if body is not None else None,
+                                   headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+                status = 'connection_error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+            if status == 200 and on_success is not None:
+                on_success(json.loads(data))
+        connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        # Client errors (e.g. no path between two actors) are legitimate answers, only listed in the status codes
+        'errors': sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 500),
+        'status_codes': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(latencies) / duration, 1) if duration else None,
+        'latency_ms': {name: round(value * 1000, 2) if value is not None else None for name, value in (
+            ('mean', sum(latencies) / len(latencies) if latencies else None),
+            ('p50', percentile(latencies, 50)),
+            ('p95', percentile(latencies, 95)),
+            ('p99', percentile(latencies, 99)),
+            ('max', latencies[-1] if latencies else None))}
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    cold_start = results.get('cold_start_ms')
+    if cold_start:
+        print(f"Cold start: {cold_start['total']} ms (target {cold_start['target']} ms"
+              f"{'' if cold_start['met'] else ', MISSED'}): import {cold_start['import']} ms, "
+              f"create_app {cold_start['create_app']} ms, first request {cold_start['first_request']} ms"
+              + (f" (base {baseline['cold_start_ms']['total']} ms)" if baseline and 'cold_start_ms' in baseline else ''))
+    print(f"{'scenario':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+          + (f"{'req/s vs base':>16}{'p95 vs base':>14}" if baseline else ''))
+    for name, result in results['scenarios'].items():
+        latency = result['latency_ms']
+        line = f"{name:<24}{result['throughput_rps'] or 0:>10}{latency['p50'] or 0:>10}{latency['p95'] or 0:>10}" \
+               f"{latency['p99'] or 0:>10}{result['errors']:>8}"
+        base = baseline['scenarios'].get(name) if baseline else None
+        if base and base['throughput_rps'] and base['latency_ms']['p95'] and latency['p95']:
+            line += f"{result['throughput_rps'] / base['throughput_rps'] - 1:>+16.1%}" \
+                    f"{latency['p95'] / base['latency_ms']['p95'] - 1:>+14.1%}"
+        print(line)
+
+
+def parse_size(value):
+    return SIZES[value.lower()] if value.lower() in SIZES else int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load benchmark of the API.')
+    parser.add_argument('--size', type=parse_size, default=SIZES['1k'],
+                        help='Actors, movies and appearances to seed: 1k, 100k, 1m or any number (default 1k).')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (default 8).')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario (default 500).')
+    parser.add_argument('--scenario', action='append', choices=[scenario.__name__ for scenario in SCENARIOS],
+                        help='Scenario to run, can be repeated (default all).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the data and the requests (default 0).')
+    parser.add_argument('--database-url', help='Database to benchmark (default a SQLite file in the work dir). '
+                                               'Seeded if it has no actors.')
+    parser.add_argument('--url', help='Benchmark an already running server (started with the JWKS_URL and '
+                                      'DATABASE_URL of the benchmark) instead of serving the app in-process.')
+    parser.add_argument('--work-dir', default=os.path.join('benchmarks', '.work'),
+                        help='Directory of the signing key, JWKS and SQLite databases.')
+    parser.add_argument('--output', help='File to save the results to, as JSON.')
+    parser.add_argument('--compare', help='Results file of a previous run to compare with.')
+    args = parser.parse_args(argv)
+
+    app, token = setup(args)
+    base_url = args.url or serve(app)
+    state = State(args.size)
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenario or scenario.__name__ in args.scenario]
+
+    results = {
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+        'size': args.size,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'seed': args.seed,
+        'cold_start_ms': measure_cold_start() if not args.url else None,
+        'scenarios': {}
+    }
+    for scenario in scenarios:
+        results['scenarios'][scenario.__name__] = run_scenario(
+            scenario, base_url, token, state, args.requests, args.concurrency, args.seed)
+    # The delete scenarios may leave some of what the others created (e.g. the batches create more than one model
+    # per request), deleted without being measured. Deleting the actors and movies deletes their appearances.
+    state.actors.extend(actor_id for actor_id, _ in state.appearances)
+    state.appearances.clear()
+    for scenario, queue in ((delete_actor, state.actors), (delete_movie, state.movies)):
+        run_scenario(scenario, base_url, token, state, len(queue), args.concurrency, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
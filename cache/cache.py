@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+# Maximum size (in bytes) of all the bodies kept in memory, and of a single one.
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESPONSE_CACHE_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+
+class ResponseCache:
+    """
+    ResponseCache
+    A thread safe LRU cache of serialized response bodies, bounded by the total size of the bodies.
+    Every body is stored along with the version of the data it was built from, a lookup with another version
+    drops the entry, so bodies are invalidated as soon as the data they were built from is written.
+    """
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, max_entry_bytes=RESPONSE_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """
+        :param key: hashable key of the response
+        :param version: current version of the data the response is built from
+        :return: (body, mimetype) tuple or None if the response is not cached for that version
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    del self._entries[key]
+                    self.size -= len(entry[1])
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, key, version, body, mimetype):
+        """
+        Stores a serialized body, evicting the least recently used ones if the cache gets too big.
+        Bodies bigger than max_entry_bytes are not cached.
+        """
+        if len(body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self._entries[key] = (version, body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted_body, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted_body)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = self.misses = self.evictions = 0
+
+
+response_cache = ResponseCache()
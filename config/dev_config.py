@@ -15,3 +15,18 @@ SQLALCHEMY_DATABASE_URI = \
                                                                     port=5432,
                                                                     db_name="movie_casting")
 
+# Connection pool, each setting can be overridden by an environment variable of the same name.
+DB_POOL_SIZE = 5
+DB_MAX_OVERFLOW = 10
+# Seconds to wait for a connection before giving up, and to recycle a connection after.
+DB_POOL_TIMEOUT = 30
+DB_POOL_RECYCLE = 1800
+# Test connections on checkout, so a database restart doesn't break the first requests.
+DB_POOL_PRE_PING = True
+# Milliseconds (Postgres only), 0 disables it.
+DB_STATEMENT_TIMEOUT = 0
+
+# Per-request timings (Server-Timing header and a JSON log line), each setting can be overridden by an environment
+# variable of the same name. Requests running more SQL statements than QUERY_BUDGET are flagged.
+INSTRUMENTATION = False
+QUERY_BUDGET = 10
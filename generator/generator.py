@@ -0,0 +1,181 @@
+import csv
+import io
+import math
+import random
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+
+from models.models import Actor, Appearance, Movie, bump_change_versions, counter_ddl, drop_counter_triggers_ddl, \
+    refresh_counters
+
+CHUNK_SIZE = 50000
+
+# The activity of the actors and the size of the casts follow Pareto (power-law) distributions: most actors appear
+# in a couple of movies and most casts are small, while a few actors have thousands of credits and a few casts
+# hundreds of actors. The lower the alpha, the heavier the tail.
+ACTOR_ACTIVITY_ALPHA = 2.0
+CAST_SIZE_ALPHA = 1.6
+MEAN_CAST_SIZE = 10
+MAX_CAST_SIZE = 1000
+
+# Releases grow by 4% a year, so recent years have many more movies than the early ones
+FIRST_RELEASE = datetime(1920, 1, 1)
+LAST_RELEASE = datetime(2025, 12, 31)
+RELEASE_GROWTH = 1.04
+FIRST_BIRTH = datetime(1900, 1, 1)
+LAST_BIRTH = datetime(2010, 12, 31)
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+               'Daniel', 'Nancy', 'Matthew', 'Lisa', 'Anthony', 'Betty', 'Mark', 'Margaret', 'Donald', 'Sandra',
+               'Steven', 'Ashley', 'Paul', 'Emily', 'Andrew', 'Donna', 'Joshua', 'Michelle', 'Kenneth', 'Carol']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Ramirez', 'Lewis', 'Robinson',
+              'Walker', 'Young', 'Allen', 'King', 'Wright', 'Scott', 'Torres', 'Nguyen', 'Hill', 'Flores']
+TITLE_WORDS = ['Night', 'Return', 'Shadow', 'Love', 'City', 'Last', 'Dark', 'River', 'Star', 'Summer', 'Secret',
+               'Empire', 'Storm', 'Ghost', 'Island', 'Winter', 'Fire', 'Dream', 'Road', 'Kingdom', 'Silent', 'Blood',
+               'Golden', 'Lost', 'Wild', 'Broken', 'Iron', 'Crimson', 'Midnight', 'Heart', 'Ocean', 'Desert',
+               'Garden', 'Mirror', 'Thunder', 'Glass', 'Stone', 'Wolf', 'Angel', 'Train']
+SEQUELS = ['II', 'III', 'IV', 'Returns', 'Reloaded']
+GENDERS = ['Male', 'Female']
+
+
+def random_date(rng, first, last, growth=1.0):
+    """
+    Returns a date between first and last. With a growth over 1, later years are exponentially more likely.
+    """
+    years = (last - first).days / 365.25
+    if growth == 1.0:
+        year = rng.random() * years
+    else:
+        # Inverse of the cumulative distribution of a density proportional to growth ** year
+        year = math.log(1 + rng.random() * (growth ** years - 1)) / math.log(growth)
+    return first + timedelta(days=int(year * 365.25))
+
+
+def generate_actors(rng, count):
+    for _ in range(count):
+        yield ('{} {}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+               random_date(rng, FIRST_BIRTH, LAST_BIRTH, RELEASE_GROWTH),
+               rng.choice(GENDERS))
+
+
+def generate_movies(rng, count):
+    for _ in range(count):
+        title = 'The {} of {}'.format(rng.choice(TITLE_WORDS), rng.choice(TITLE_WORDS)) if rng.random() < 0.3 else \
+            '{} {}'.format(rng.choice(TITLE_WORDS), rng.choice(TITLE_WORDS))
+        if rng.random() < 0.05:
+            title = '{} {}'.format(title, rng.choice(SEQUELS))
+        yield title, random_date(rng, FIRST_RELEASE, LAST_RELEASE, RELEASE_GROWTH)
+
+
+def generate_appearances(rng, actor_ids, movie_ids, mean_cast_size=MEAN_CAST_SIZE):
+    """
+    Yields the (actor_id, movie_id) appearances of a cast of power-law size for every movie, its actors picked with
+    probability proportional to their (power-law) activity.
+    """
+    # Cumulative activity of the actors, in an array of doubles so tens of millions of actors fit in memory
+    activity = array('d', accumulate(rng.paretovariate(ACTOR_ACTIVITY_ALPHA) for _ in actor_ids))
+    # Pareto with the given mean: mean = minimum * alpha / (alpha - 1)
+    minimum_cast_size = mean_cast_size * (CAST_SIZE_ALPHA - 1) / CAST_SIZE_ALPHA
+    for movie_id in movie_ids:
+        cast_size = min(MAX_CAST_SIZE, len(actor_ids),
+                        max(1, int(round(minimum_cast_size * rng.paretovariate(CAST_SIZE_ALPHA)))))
+        cast = set()
+        # Prolific actors are picked again now and then, so a few extra draws may be needed to fill the cast
+        for _ in range(4):
+            cast.update(rng.choices(actor_ids, cum_weights=activity, k=cast_size - len(cast)))
+            if len(cast) == cast_size:
+                break
+        for actor_id in sorted(cast):
+            yield actor_id, movie_id
+
+
+def chunks(rows, chunk_size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_load(connection, table, columns, rows, chunk_size=CHUNK_SIZE):
+    """
+    Loads the rows (tuples of the given columns) into the table: with COPY on Postgres, and with executemany inserts
+    on any other database.
+    :return: number of loaded rows
+    """
+    count = 0
+    if connection.dialect.name == 'postgresql':
+        cursor = connection.connection.cursor()
+        statement = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(table.name, ', '.join(columns))
+        for chunk in chunks(rows, chunk_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            count += len(chunk)
+    else:
+        for chunk in chunks(rows, chunk_size):
+            connection.execute(table.insert(), [dict(zip(columns, row)) for row in chunk])
+            count += len(chunk)
+    return count
+
+
+def next_id(connection, table):
+    return (connection.execute(table.select().with_only_columns([table.c.id]).order_by(table.c.id.desc()).limit(1))
+            .scalar() or 0) + 1
+
+
+def generate_catalog(engine, actors, movies, appearances=None, seed=0, chunk_size=CHUNK_SIZE, log=print):
+    """
+    generate_catalog(engine, actors, movies, appearances=None, seed=0)
+        fills the actors, movies and appearances tables with a synthetic catalog, in a single transaction
+        the rows are appended after the existing ones, and the same seed always generates the same catalog
+        appearances is the approximate number of appearances (MEAN_CAST_SIZE per movie by default)
+        returns the number of generated rows of each table
+        EXAMPLE
+            generate_catalog(db.engine, actors=1000000, movies=300000, seed=42)
+    """
+    rng = random.Random(seed)
+    mean_cast_size = appearances / movies if appearances and movies else MEAN_CAST_SIZE
+    counts = {}
+    with engine.begin() as connection:
+        first_actor_id = next_id(connection, Actor.__table__)
+        first_movie_id = next_id(connection, Movie.__table__)
+        actor_ids = range(first_actor_id, first_actor_id + actors)
+        movie_ids = range(first_movie_id, first_movie_id + movies)
+        # Maintaining the summary columns row by row would make the load several times slower: the triggers are
+        # dropped until the end of the transaction, and the summary columns of the new rows computed at once instead
+        for statement in drop_counter_triggers_ddl(connection.dialect.name):
+            connection.exec_driver_sql(statement)
+
+        # The ids are given explicitly, so the appearances can reference them without reading them back
+        counts['actors'] = bulk_load(connection, Actor.__table__, ('id', 'name', 'birth_date', 'gender'),
+                                     ((actor_id,) + row for actor_id, row in
+                                      zip(actor_ids, generate_actors(rng, actors))), chunk_size)
+        log('{} actors generated'.format(counts['actors']))
+        counts['movies'] = bulk_load(connection, Movie.__table__, ('id', 'title', 'release_date'),
+                                     ((movie_id,) + row for movie_id, row in
+                                      zip(movie_ids, generate_movies(rng, movies))), chunk_size)
+        log('{} movies generated'.format(counts['movies']))
+        counts['appearances'] = bulk_load(connection, Appearance.__table__, ('actor_id', 'movie_id'),
+                                          generate_appearances(rng, actor_ids, movie_ids, mean_cast_size)
+                                          if actors else (), chunk_size)
+        log('{} appearances generated'.format(counts['appearances']))
+
+        refresh_counters(connection, first_actor_id, first_movie_id)
+        for statement in counter_ddl(connection.dialect.name):
+            connection.exec_driver_sql(statement)
+
+        if connection.dialect.name == 'postgresql':
+            # COPY with explicit ids doesn't advance the id sequences
+            for table in ('actors', 'movies'):
+                connection.exec_driver_sql(
+                    "SELECT setval(pg_get_serial_sequence('{0}', 'id'), (SELECT max(id) FROM {0}))".format(table))
+        # Bulk loads bypass the session, so the cached responses are invalidated explicitly
+        bump_change_versions(connection, ['actors', 'movies', 'appearances'])
+    return counts
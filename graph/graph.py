@@ -0,0 +1,279 @@
+import threading
+from array import array
+from collections import Counter, defaultdict
+from itertools import accumulate
+from operator import itemgetter
+
+from sqlalchemy import event
+
+from models.models import Appearance, db, get_change_versions, primary_reads
+
+# Writes are kept in an overlay on top of the compact arrays, which are rebuilt from the overlay once it holds more
+# than this many edges, or this share of the edges of the arrays.
+OVERLAY_MIN_EDGES = 10000
+OVERLAY_MAX_SHARE = 0.05
+# Bound of the shortest path searches, in actor-to-actor hops.
+MAX_DEGREES = 6
+
+
+def compressed_rows(pairs, key, size):
+    """
+    Builds the compressed sparse row adjacency of the pairs grouped by their key element (0 or 1): the neighbors of
+    node i are targets[offsets[i]:offsets[i + 1]].
+    :return: (offsets, targets) arrays
+    """
+    by_key = itemgetter(key)
+    ordered = sorted(pairs, key=by_key)
+    targets = array('i', map(itemgetter(1 - key), ordered))
+    counts = Counter(map(by_key, ordered))
+    offsets = array('i', [0]) + array('i', accumulate(counts.get(node, 0) for node in range(size)))
+    return offsets, targets
+
+
+class Adjacency:
+    """
+    Adjacency
+    the bipartite actor-movie graph in compressed sparse rows, both ways: movies of each actor, cast of each movie
+    """
+
+    def __init__(self, pairs):
+        pairs = list(pairs)
+        self.edges = len(pairs)
+        self.actor_count = max(map(itemgetter(0), pairs), default=0) + 1
+        self.movie_count = max(map(itemgetter(1), pairs), default=0) + 1
+        self.actor_offsets, self.actor_movies = compressed_rows(pairs, 0, self.actor_count)
+        self.movie_offsets, self.movie_actors = compressed_rows(pairs, 1, self.movie_count)
+
+    def movies(self, actor_id):
+        if actor_id >= self.actor_count:
+            return ()
+        return self.actor_movies[self.actor_offsets[actor_id]:self.actor_offsets[actor_id + 1]]
+
+    def cast(self, movie_id):
+        if movie_id >= self.movie_count:
+            return ()
+        return self.movie_actors[self.movie_offsets[movie_id]:self.movie_offsets[movie_id + 1]]
+
+
+class CoStarIndex:
+    """
+    CoStarIndex
+    A process-wide, in-memory index of the appearances, to answer co-star and degrees of separation queries without
+    walking the appearances table.
+    - It is built from the appearances on first use, and kept in step with the change version of the table.
+    - The writes of appearances through the session are applied to it (in an overlay) once committed, so it stays
+      fresh without a rebuild.
+    - Any other change to the table (e.g. a write of another process, a cascade) makes it stale: the next request
+      rebuilds it, while concurrent requests keep being served the previous one.
+    """
+
+    def __init__(self):
+        self._adjacency = None
+        self._version = None
+        self._added_movies = defaultdict(set)
+        self._added_cast = defaultdict(set)
+        self._removed = set()
+        self._lock = threading.RLock()
+        self._building = threading.Lock()
+
+    def _load(self, version):
+        pairs = db.session.query(Appearance.actor_id, Appearance.movie_id).yield_per(50000)
+        adjacency = Adjacency((actor_id, movie_id) for actor_id, movie_id in pairs)
+        with self._lock:
+            self._adjacency = adjacency
+            self._version = version
+            self._added_movies.clear()
+            self._added_cast.clear()
+            self._removed.clear()
+
+    def refresh(self):
+        """
+        Builds the index, or rebuilds it if the appearances changed behind its back.
+        Must be called within an app context, before reading the index.
+        The version and the appearances are read from the primary: a lagging replica would rebuild the index from
+        older appearances than the ones it already holds.
+        """
+        with primary_reads():
+            version, = get_change_versions('appearances')
+            with self._lock:
+                if self._adjacency is not None and self._version == version:
+                    return
+                stale = self._adjacency is not None
+            # Only one request rebuilds a stale index, the others keep reading the previous one meanwhile
+            if self._building.acquire(blocking=not stale):
+                try:
+                    with self._lock:
+                        if self._adjacency is not None and self._version == version:
+                            return
+                    self._load(version)
+                finally:
+                    self._building.release()
+
+    def apply(self, version, added=(), removed=()):
+        """
+        Applies the appearance writes of a committed transaction, as (actor_id, movie_id) pairs, to the index.
+        The index stays fresh only if these writes are the only ones since it was last in step, i.e. if the
+        transaction bumped the change version of the appearances to the one following the version of the index.
+        """
+        with self._lock:
+            if self._adjacency is None:
+                return
+            if self._version is None or version != self._version + 1:
+                # Other writes happened in between, or a refresh already loaded these ones: applying them again
+                # would duplicate or resurrect edges, so the next read rebuilds the index instead
+                self._version = None
+                return
+            for actor_id, movie_id in removed:
+                if movie_id in self._added_movies.get(actor_id, ()):
+                    self._added_movies[actor_id].discard(movie_id)
+                    self._added_cast[movie_id].discard(actor_id)
+                else:
+                    self._removed.add((actor_id, movie_id))
+            for actor_id, movie_id in added:
+                if (actor_id, movie_id) in self._removed:
+                    self._removed.discard((actor_id, movie_id))
+                else:
+                    self._added_movies[actor_id].add(movie_id)
+                    self._added_cast[movie_id].add(actor_id)
+            self._version = version
+            overlay = len(self._removed) + sum(len(movies) for movies in self._added_movies.values())
+            if overlay > max(OVERLAY_MIN_EDGES, OVERLAY_MAX_SHARE * self._adjacency.edges):
+                self._compact()
+
+    def _compact(self):
+        # Actors newer than the arrays only have edges in the overlay
+        actor_ids = set(range(self._adjacency.actor_count)).union(self._added_movies)
+        pairs = [(actor_id, movie_id) for actor_id in actor_ids for movie_id in self._movies(actor_id)]
+        self._adjacency = Adjacency(pairs)
+        self._added_movies.clear()
+        self._added_cast.clear()
+        self._removed.clear()
+
+    def clear(self):
+        with self._lock:
+            self._adjacency = None
+            self._version = None
+            self._added_movies.clear()
+            self._added_cast.clear()
+            self._removed.clear()
+
+    def _movies(self, actor_id):
+        movies = self._adjacency.movies(actor_id)
+        if self._removed:
+            movies = [movie_id for movie_id in movies if (actor_id, movie_id) not in self._removed]
+        added = self._added_movies.get(actor_id)
+        return list(movies) + list(added) if added else movies
+
+    def _cast(self, movie_id):
+        cast = self._adjacency.cast(movie_id)
+        if self._removed:
+            cast = [actor_id for actor_id in cast if (actor_id, movie_id) not in self._removed]
+        added = self._added_cast.get(movie_id)
+        return list(cast) + list(added) if added else cast
+
+    def co_stars(self, actor_id):
+        """
+        :return: Counter of the actors sharing at least one movie with the actor, by number of shared movies
+        """
+        with self._lock:
+            counts = Counter()
+            for movie_id in self._movies(actor_id):
+                counts.update(self._cast(movie_id))
+        counts.pop(actor_id, None)
+        return counts
+
+    def shortest_path(self, source_id, target_id, max_degrees=MAX_DEGREES):
+        """
+        Bidirectional breadth-first search of the shortest chain of co-stars between two actors, expanding the
+        smaller frontier first and scanning the cast of each movie at most once per side.
+        :return: (actor_ids, movie_ids) tuple, movie_ids[i] being shared by actor_ids[i] and actor_ids[i + 1], or
+        None if the actors are more than max_degrees apart
+        """
+        if source_id == target_id:
+            return [source_id], []
+        with self._lock:
+            # Depth and (previous actor, shared movie) of every reached actor, from each side
+            reached = ({source_id: (0, None)}, {target_id: (0, None)})
+            frontiers = ([source_id], [target_id])
+            scanned_movies = (set(), set())
+            depths = [0, 0]
+            while frontiers[0] and frontiers[1] and sum(depths) < max_degrees:
+                side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+                mine, theirs = reached[side], reached[1 - side]
+                depths[side] += 1
+                meetings = []
+                next_frontier = []
+                for actor_id in frontiers[side]:
+                    for movie_id in self._movies(actor_id):
+                        if movie_id in scanned_movies[side]:
+                            continue
+                        scanned_movies[side].add(movie_id)
+                        for co_star_id in self._cast(movie_id):
+                            if co_star_id in mine:
+                                continue
+                            mine[co_star_id] = (depths[side], (actor_id, movie_id))
+                            if co_star_id in theirs:
+                                meetings.append(co_star_id)
+                            next_frontier.append(co_star_id)
+                if meetings:
+                    # Every meeting of the level is as close to this side, the closest to the other side wins
+                    meeting = min(meetings, key=lambda actor_id: theirs[actor_id][0])
+                    return self._join(reached, meeting)
+                frontiers[side][:] = next_frontier
+        return None
+
+    @staticmethod
+    def _join(reached, meeting):
+        actor_ids, movie_ids = [meeting], []
+        for side in (0, 1):
+            actor_id = meeting
+            chain_actors, chain_movies = [], []
+            while reached[side][actor_id][1] is not None:
+                actor_id, movie_id = reached[side][actor_id][1]
+                chain_actors.append(actor_id)
+                chain_movies.append(movie_id)
+            if side == 0:
+                actor_ids = chain_actors[::-1] + actor_ids
+                movie_ids = chain_movies[::-1] + movie_ids
+            else:
+                actor_ids += chain_actors
+                movie_ids += chain_movies
+        return actor_ids, movie_ids
+
+    def stats(self):
+        with self._lock:
+            if self._adjacency is None:
+                return {'built': False}
+            return {
+                'built': True,
+                'version': self._version,
+                'edges': self._adjacency.edges,
+                'overlay': len(self._removed) + sum(len(movies) for movies in self._added_movies.values())
+            }
+
+
+costar_index = CoStarIndex()
+
+
+@event.listens_for(db.session, 'before_commit')
+def read_committed_appearances_version(session):
+    """
+    Reads the change version of the appearances that the transaction is about to commit, once the flush and the bump
+    of the versions (see models.py, whose listener runs first) are done, as the session can't query after the commit.
+    """
+    writes = session.info.get('appearance_writes')
+    if writes and not session.in_nested_transaction():
+        writes['version'], = get_change_versions('appearances')
+
+
+@event.listens_for(db.session, 'after_commit')
+def apply_committed_appearances(session):
+    """
+    Applies the appearance writes of the transaction to the co-star index once they are committed: writes that are
+    rolled back (i.e. by a failing /batch) never reach it. Releasing a SAVEPOINT commits nothing.
+    """
+    if session.in_nested_transaction():
+        return
+    writes = session.info.pop('appearance_writes', None)
+    if writes and 'version' in writes:
+        costar_index.apply(writes['version'], writes['added'], writes['removed'])
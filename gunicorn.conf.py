@@ -0,0 +1,36 @@
+import os
+
+from prometheus_client import multiprocess
+
+from auth.auth import jwks_store
+from graph.graph import costar_index
+from models.models import dispose_engines
+
+# Load the app once in the master and fork the workers from it, so they start warm: modules imported, app created,
+# signing keys fetched and co-star index built. GUNICORN_PRELOAD=0 disables it (e.g. to reload the code with a HUP
+# signal).
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        jwks_store.warm()
+        # The workers share the pages of the co-star index built here, until they write to them
+        app = server.app.wsgi()
+        try:
+            with app.app_context():
+                costar_index.refresh()
+        except Exception as error:
+            print(f'Unable to build the co-star index: {error!r}')
+
+
+def pre_fork(server, worker):
+    # The workers open their own database connections
+    if server.cfg.preload_app:
+        dispose_engines(server.app.wsgi())
+
+
+def child_exit(server, worker):
+    # Drop the gauges of a dead worker from the aggregated /metrics
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
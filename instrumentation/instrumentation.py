@@ -0,0 +1,73 @@
+import json
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Number of SQL statements above which a request is flagged, to catch N+1 regressions
+QUERY_BUDGET = 10
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start'].pop()
+    if has_request_context() and 'timings' in g:
+        g.timings['queries'] += 1
+        g.timings['sql_time'] += time.perf_counter() - start
+
+
+def setup_instrumentation(app):
+    """
+    setup_instrumentation(app)
+        records, for every request of the app, the time spent authenticating, the number of SQL statements and
+        the time spent running them, and the time spent in Python (describing and serializing the results).
+        They are sent back in a Server-Timing header and printed as a JSON log line, flagged if the number of
+        statements exceeds the QUERY_BUDGET config value.
+    """
+    query_budget = app.config.get('QUERY_BUDGET', QUERY_BUDGET)
+
+    # Engine events are global, so every engine (i.e. read replicas) is instrumented
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    @app.before_request
+    def start_timings():
+        g.timings = {'start': time.perf_counter(), 'queries': 0, 'sql_time': 0.0}
+
+    @app.after_request
+    def report_timings(response):
+        timings = g.pop('timings', None)
+        if timings is None:
+            return response
+
+        total = time.perf_counter() - timings['start']
+        auth = g.get('auth_time', 0.0)
+        sql = timings['sql_time']
+        python = max(total - auth - sql, 0.0)
+        response.headers['Server-Timing'] = ', '.join((
+            f'auth;dur={auth * 1000:.2f}',
+            f'db;dur={sql * 1000:.2f};desc="{timings["queries"]} queries"',
+            f'app;dur={python * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}'
+        ))
+
+        log = {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'auth_ms': round(auth * 1000, 2),
+            'sql_ms': round(sql * 1000, 2),
+            'app_ms': round(python * 1000, 2),
+            'queries': timings['queries']
+        }
+        if timings['queries'] > query_budget:
+            log['over_query_budget'] = True
+        print(json.dumps(log))
+        return response
@@ -1,14 +1,25 @@
 from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
+from flask_migrate import MigrateCommand
 
-from app import app
+from app import create_app
+from generator.generator import generate_catalog
 from models.models import db
 
-migrate = Migrate(app, db)
-manager = Manager(app)
+# Manager creates the app with the factory when a command runs (setup_db also sets up the migrations)
+manager = Manager(create_app)
 
 manager.add_command('db', MigrateCommand)
 
 
+@manager.option('--actors', type=int, default=100000, help='Number of actors to generate.')
+@manager.option('--movies', type=int, default=30000, help='Number of movies to generate.')
+@manager.option('--appearances', type=int, default=None,
+                help='Approximate number of appearances (10 per movie by default).')
+@manager.option('--seed', type=int, default=0, help='Seed of the generator, the same seed gives the same catalog.')
+def generate(actors, movies, appearances, seed):
+    """Fills the database with a synthetic catalog of actors, movies and appearances."""
+    generate_catalog(db.engine, actors, movies, appearances, seed)
+
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
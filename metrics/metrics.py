@@ -0,0 +1,78 @@
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, \
+    generate_latest, multiprocess
+
+from auth.auth import token_cache
+from cache.cache import response_cache
+from models.models import pool_stats
+
+# With several gunicorn workers, each one writes its metrics to PROMETHEUS_MULTIPROC_DIR and /metrics aggregates
+# them (see gunicorn.conf.py). Gauges are summed over the live workers.
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+REQUESTS = Counter('http_requests_total', 'Requests handled, by route, method and status code.',
+                   ['endpoint', 'method', 'status'])
+LATENCY = Histogram('http_request_duration_seconds', 'Request latency, by route.', ['endpoint'],
+                    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 10.0))
+
+POOL = Gauge('db_pool_connections', 'Database connections of the pool, by state.', ['state'],
+             multiprocess_mode='livesum')
+# Set from the running total of the pool, which restarts with the worker: a gauge, so without the _total suffix of
+# the counters
+POOL_WAIT = Gauge('db_pool_wait_seconds', 'Time spent waiting for a database connection.',
+                  multiprocess_mode='livesum')
+TOKEN_CACHE = Gauge('auth_token_cache', 'Verified token cache entries and lookups.', ['stat'],
+                    multiprocess_mode='livesum')
+RESPONSE_CACHE = Gauge('response_cache', 'Response cache entries, size in bytes and lookups.', ['stat'],
+                       multiprocess_mode='livesum')
+
+
+def update_gauges():
+    stats = pool_stats()
+    for state in ('size', 'checked_in', 'checked_out', 'overflow'):
+        if state in stats:
+            POOL.labels(state).set(stats[state])
+    if 'wait_time_total' in stats:
+        POOL_WAIT.set(stats['wait_time_total'])
+
+    for stat, value in token_cache.stats().items():
+        if stat != 'hit_ratio':
+            TOKEN_CACHE.labels(stat).set(value)
+    for stat, value in response_cache.stats().items():
+        if stat != 'hit_ratio':
+            RESPONSE_CACHE.labels(stat).set(value)
+
+
+def setup_metrics(app):
+    """
+    setup_metrics(app)
+        counts the requests of the app and observes their latency, labeled by endpoint (the route function names),
+        and exposes them, along with the database pool and cache gauges, at /metrics in Prometheus text format
+    """
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None and request.endpoint != 'metrics':
+            endpoint = request.endpoint or 'not_found'
+            LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+            REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+            update_gauges()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        update_gauges()
+        if MULTIPROCESS:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
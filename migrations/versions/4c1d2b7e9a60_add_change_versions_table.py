@@ -0,0 +1,33 @@
+"""Add change_versions table
+
+Revision ID: 4c1d2b7e9a60
+Revises: 75eabfd3de58
+Create Date: 2026-10-17 10:12:41.306214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1d2b7e9a60'
+down_revision = '75eabfd3de58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    change_versions = op.create_table('change_versions',
+    sa.Column('table_name', sa.String(length=120), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(change_versions, [
+        {'table_name': 'actors', 'version': 0},
+        {'table_name': 'movies', 'version': 0},
+        {'table_name': 'appearances', 'version': 0},
+    ])
+
+
+def downgrade():
+    op.drop_table('change_versions')
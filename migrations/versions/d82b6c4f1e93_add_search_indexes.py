@@ -0,0 +1,61 @@
+"""Add search indexes on actors.name and movies.title
+
+Revision ID: d82b6c4f1e93
+Revises: 9e3f5a1c7b24
+Create Date: 2026-10-17 11:48:05.734120
+
+"""
+import sqlite3
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd82b6c4f1e93'
+down_revision = '9e3f5a1c7b24'
+branch_labels = None
+depends_on = None
+
+SEARCHABLE_COLUMNS = (('actors', 'name'), ('movies', 'title'))
+# The trigram tokenizer of FTS5 came with SQLite 3.34, the searches fall back to LIKE without it
+SQLITE_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table_name, column_name in SEARCHABLE_COLUMNS:
+            op.execute(f'CREATE INDEX ix_{table_name}_{column_name}_trgm '
+                       f'ON {table_name} USING gin ({column_name} gin_trgm_ops)')
+
+    elif dialect == 'sqlite' and SQLITE_TRIGRAM:
+        for table_name, column_name in SEARCHABLE_COLUMNS:
+            search_table = f'{table_name}_search'
+            op.execute(f"CREATE VIRTUAL TABLE {search_table} USING fts5({column_name}, "
+                       f"content='{table_name}', content_rowid='id', tokenize='trigram')")
+            op.execute(f'CREATE TRIGGER {search_table}_insert AFTER INSERT ON {table_name} BEGIN '
+                       f'INSERT INTO {search_table}(rowid, {column_name}) VALUES (new.id, new.{column_name}); END')
+            op.execute(f'CREATE TRIGGER {search_table}_delete AFTER DELETE ON {table_name} BEGIN '
+                       f"INSERT INTO {search_table}({search_table}, rowid, {column_name}) "
+                       f"VALUES ('delete', old.id, old.{column_name}); END")
+            op.execute(f'CREATE TRIGGER {search_table}_update AFTER UPDATE ON {table_name} BEGIN '
+                       f"INSERT INTO {search_table}({search_table}, rowid, {column_name}) "
+                       f"VALUES ('delete', old.id, old.{column_name}); "
+                       f'INSERT INTO {search_table}(rowid, {column_name}) VALUES (new.id, new.{column_name}); END')
+            op.execute(f"INSERT INTO {search_table}({search_table}) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table_name, column_name in SEARCHABLE_COLUMNS:
+            op.execute(f'DROP INDEX ix_{table_name}_{column_name}_trgm')
+
+    elif dialect == 'sqlite':
+        for table_name, _ in SEARCHABLE_COLUMNS:
+            search_table = f'{table_name}_search'
+            # Not created by an upgrade on SQLite older than 3.34
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute(f'DROP TRIGGER IF EXISTS {search_table}_{trigger}')
+            op.execute(f'DROP TABLE IF EXISTS {search_table}')
@@ -0,0 +1,116 @@
+"""Add summary columns on actors and movies, maintained by triggers on appearances
+
+Revision ID: e5a7c9b3d1f2
+Revises: d82b6c4f1e93
+Create Date: 2026-10-17 15:22:41.306518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c9b3d1f2'
+down_revision = 'd82b6c4f1e93'
+branch_labels = None
+depends_on = None
+
+
+def release_year(column, dialect):
+    if dialect == 'postgresql':
+        return f'CAST(EXTRACT(YEAR FROM {column}) AS INTEGER)'
+    return f'CAST(substr({column}, 1, 4) AS INTEGER)'
+
+
+def filmography_years(actor_id, dialect, aggregate):
+    return (f'(SELECT {aggregate}({release_year("movies.release_date", dialect)}) FROM appearances '
+            f'JOIN movies ON movies.id = appearances.movie_id WHERE appearances.actor_id = {actor_id})')
+
+
+def upgrade():
+    op.add_column('actors', sa.Column('appearance_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('actors', sa.Column('first_release_year', sa.Integer(), nullable=True))
+    op.add_column('actors', sa.Column('last_release_year', sa.Integer(), nullable=True))
+    op.add_column('movies', sa.Column('cast_size', sa.Integer(), server_default='0', nullable=False))
+
+    dialect = op.get_bind().dialect.name
+    # Backfill, before the triggers exist
+    op.execute('UPDATE actors SET '
+               'appearance_count = (SELECT count(*) FROM appearances WHERE actor_id = actors.id), '
+               f"first_release_year = {filmography_years('actors.id', dialect, 'min')}, "
+               f"last_release_year = {filmography_years('actors.id', dialect, 'max')}")
+    op.execute('UPDATE movies SET cast_size = (SELECT count(*) FROM appearances WHERE movie_id = movies.id)')
+    op.create_index(op.f('ix_actors_appearance_count'), 'actors', ['appearance_count'], unique=False)
+    op.create_index(op.f('ix_movies_cast_size'), 'movies', ['cast_size'], unique=False)
+
+    if dialect == 'postgresql':
+        year = release_year('release_date', dialect)
+        op.execute('CREATE OR REPLACE FUNCTION appearances_counters() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+                   "IF TG_OP = 'INSERT' THEN "
+                   'UPDATE actors SET appearance_count = appearance_count + 1, '
+                   'first_release_year = LEAST(first_release_year, movie.year), '
+                   'last_release_year = GREATEST(last_release_year, movie.year) '
+                   f'FROM (SELECT {year} AS year FROM movies WHERE id = NEW.movie_id) AS movie '
+                   'WHERE actors.id = NEW.actor_id; '
+                   'UPDATE movies SET cast_size = cast_size + 1 WHERE id = NEW.movie_id; '
+                   'RETURN NEW; '
+                   'END IF; '
+                   'UPDATE actors SET appearance_count = appearance_count - 1, '
+                   f"first_release_year = {filmography_years('OLD.actor_id', dialect, 'min')}, "
+                   f"last_release_year = {filmography_years('OLD.actor_id', dialect, 'max')} "
+                   'WHERE id = OLD.actor_id; '
+                   'UPDATE movies SET cast_size = cast_size - 1 WHERE id = OLD.movie_id; '
+                   'RETURN OLD; '
+                   'END $$')
+        op.execute('CREATE TRIGGER appearances_counters AFTER INSERT OR DELETE ON appearances '
+                   'FOR EACH ROW EXECUTE PROCEDURE appearances_counters()')
+        op.execute('CREATE OR REPLACE FUNCTION movies_release_years() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+                   f"UPDATE actors SET first_release_year = {filmography_years('actors.id', dialect, 'min')}, "
+                   f"last_release_year = {filmography_years('actors.id', dialect, 'max')} "
+                   'WHERE id IN (SELECT actor_id FROM appearances WHERE movie_id = NEW.id); '
+                   'RETURN NEW; '
+                   'END $$')
+        op.execute('CREATE TRIGGER movies_release_years AFTER UPDATE OF release_date ON movies FOR EACH ROW '
+                   'WHEN (OLD.release_date IS DISTINCT FROM NEW.release_date) '
+                   'EXECUTE PROCEDURE movies_release_years()')
+
+    elif dialect == 'sqlite':
+        year = f"(SELECT {release_year('release_date', dialect)} FROM movies WHERE id = new.movie_id)"
+        op.execute('CREATE TRIGGER appearances_counters_insert AFTER INSERT ON appearances BEGIN '
+                   'UPDATE actors SET appearance_count = appearance_count + 1, '
+                   f'first_release_year = min(coalesce(first_release_year, {year}), {year}), '
+                   f'last_release_year = max(coalesce(last_release_year, {year}), {year}) '
+                   'WHERE id = new.actor_id; '
+                   'UPDATE movies SET cast_size = cast_size + 1 WHERE id = new.movie_id; END')
+        op.execute('CREATE TRIGGER appearances_counters_delete AFTER DELETE ON appearances BEGIN '
+                   'UPDATE actors SET appearance_count = appearance_count - 1, '
+                   f"first_release_year = {filmography_years('old.actor_id', dialect, 'min')}, "
+                   f"last_release_year = {filmography_years('old.actor_id', dialect, 'max')} "
+                   'WHERE id = old.actor_id; '
+                   'UPDATE movies SET cast_size = cast_size - 1 WHERE id = old.movie_id; END')
+        op.execute('CREATE TRIGGER movies_release_years AFTER UPDATE OF release_date ON movies BEGIN '
+                   f"UPDATE actors SET first_release_year = {filmography_years('actors.id', dialect, 'min')}, "
+                   f"last_release_year = {filmography_years('actors.id', dialect, 'max')} "
+                   'WHERE id IN (SELECT actor_id FROM appearances WHERE movie_id = new.id); END')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP TRIGGER appearances_counters ON appearances')
+        op.execute('DROP FUNCTION appearances_counters()')
+        op.execute('DROP TRIGGER movies_release_years ON movies')
+        op.execute('DROP FUNCTION movies_release_years()')
+
+    elif dialect == 'sqlite':
+        for trigger in ('appearances_counters_insert', 'appearances_counters_delete', 'movies_release_years'):
+            op.execute(f'DROP TRIGGER {trigger}')
+
+    op.drop_index(op.f('ix_movies_cast_size'), table_name='movies')
+    op.drop_index(op.f('ix_actors_appearance_count'), table_name='actors')
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.drop_column('cast_size')
+    with op.batch_alter_table('actors') as batch_op:
+        batch_op.drop_column('last_release_year')
+        batch_op.drop_column('first_release_year')
+        batch_op.drop_column('appearance_count')
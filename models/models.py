@@ -1,25 +1,570 @@
 import datetime
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 
+from flask import has_request_context, request
 from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, DDL, event, func, or_, select, literal_column
+from sqlalchemy import delete, text
+from sqlalchemy import table as table_clause, column as column_clause
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, selectinload, load_only, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+# Seconds between two health checks of a read replica, and seconds a failing replica is left out
+REPLICA_CHECK_INTERVAL = 5
+REPLICA_RETRY_AFTER = 30
+
+# The trigram tokenizer of FTS5 came with SQLite 3.34: with an older library, the searches scan the column with LIKE
+SQLITE_TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+
+
+class ReplicaRouter:
+    """
+    ReplicaRouter
+    picks the read replica to use, round-robin among the ones that passed their last health check
+    """
+
+    def __init__(self, bind_keys, check_interval=REPLICA_CHECK_INTERVAL, retry_after=REPLICA_RETRY_AFTER):
+        self.bind_keys = list(bind_keys)
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self._next = 0
+        self._checked_at = {}
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def _is_healthy(self, bind_key, engine):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._down_until.get(bind_key, 0):
+                return False
+            if now - self._checked_at.get(bind_key, float('-inf')) < self.check_interval:
+                return True
+            self._checked_at[bind_key] = now
+        try:
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return True
+        except Exception as error:
+            print(f'Read replica {bind_key} is down: {error!r}')
+            with self._lock:
+                self._down_until[bind_key] = now + self.retry_after
+            return False
+
+    def choose(self, get_engine):
+        """
+        :param get_engine: function returning the engine of a bind key
+        :return: the bind key of a healthy replica, None if there is none
+        """
+        for _ in range(len(self.bind_keys)):
+            with self._lock:
+                bind_key = self.bind_keys[self._next % len(self.bind_keys)]
+                self._next += 1
+            if self._is_healthy(bind_key, get_engine(bind_key)):
+                return bind_key
+        return None
+
+
+class RoutingSession(SignallingSession):
+    """
+    RoutingSession
+    a session that sends the queries of GET requests to a read replica (the same one for the whole request),
+    and everything else, including the reads following a write in the same request and the reads within
+    primary_reads(), to the primary
+    """
+
+    def _replica_engine(self):
+        router = self.app.extensions.get('replica_router')
+        # Pending changes are flushed before any query, and a flush marks the session as written
+        if router is None or not router.bind_keys or self.info.get('wrote') or self.info.get('primary') \
+                or self._flushing or not has_request_context() or request.method not in ('GET', 'HEAD'):
+            return None
+
+        def get_engine(bind_key):
+            return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind=bind_key)
+
+        if 'replica' not in self.info:
+            self.info['replica'] = router.choose(get_engine)
+        return get_engine(self.info['replica']) if self.info['replica'] else None
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        return self._replica_engine() or super().get_bind(mapper, clause)
+
+
+@contextmanager
+def primary_reads():
+    """
+    primary_reads()
+        sends the queries of the block to the primary, even in a GET request, for the reads that must see every
+        committed write (a replica may lag behind)
+        EXAMPLE
+            with primary_reads():
+                version, = get_change_versions('appearances')
+    """
+    nested = db.session.info.get('primary')
+    db.session.info['primary'] = True
+    try:
+        yield
+    finally:
+        if not nested:
+            db.session.info.pop('primary', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        if engine.dialect.name == 'sqlite':
+            # pysqlite only emits BEGIN before a write, so a SAVEPOINT (see /batch) would open the transaction itself
+            # and releasing it would commit everything. Reads stay outside of transactions, not to hold locks that
+            # block the writers, and transactions of savepoints take the write lock up front: upgrading a read lock
+            # fails at once when another connection writes, instead of waiting for it.
+            @event.listens_for(engine, 'savepoint')
+            def begin(connection, name):
+                if not connection.connection.in_transaction:
+                    connection.exec_driver_sql('BEGIN IMMEDIATE')
+        return engine
+
 
 Base = declarative_base()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+
+
+# Connection pool settings and their defaults
+POOL_DEFAULTS = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_POOL_PRE_PING': True,
+    'DB_STATEMENT_TIMEOUT': 0
+}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    InstrumentedQueuePool
+    a QueuePool that also records how long checkouts wait for a connection
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+
+    def recreate(self):
+        # Keep the class (and its stats) when the pool is recreated, i.e. after a database restart
+        pool = super().recreate()
+        pool.checkouts, pool.wait_time, pool.max_wait_time = self.checkouts, self.wait_time, self.max_wait_time
+        return pool
+
+
+def engine_options(config):
+    """
+    engine_options(config)
+        SQLAlchemy engine options built from the DB_* pool settings of the config
+    """
+    database_uri = config['SQLALCHEMY_DATABASE_URI']
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE']
+    }
+    if database_uri.startswith('sqlite'):
+        # SQLite uses its own pools, which don't take a size
+        return options
+
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT']
+    })
+    if database_uri.startswith('postgresql') and config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"}
+    return options
+
+
+def pool_stats():
+    """
+    pool_stats()
+        current state of the connection pool: connections in use, overflow and checkout wait times
+    """
+    pool = db.engine.pool
+    if not isinstance(pool, QueuePool):
+        return {'status': pool.status()}
+
+    stats = {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'max_overflow': pool._max_overflow
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update({
+                'checkouts': pool.checkouts,
+                'wait_time_total': pool.wait_time,
+                'wait_time_max': pool.max_wait_time
+            })
+    return stats
+
+
+def dispose_engines(app):
+    """
+    dispose_engines(app)
+        drops the pooled connections of the app, to the primary database and to the replicas
+        to be called before forking, so worker processes never share a database connection
+    """
+    for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or {}):
+        db.get_engine(app, bind).dispose()
 
 
 def setup_db(app):
     """
     setup_db(app)
         binds a flask application and a SQLAlchemy service
+        the engine options are built from the DB_* pool settings of the app config
     """
+    for key, default in POOL_DEFAULTS.items():
+        app.config.setdefault(key, default)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    # Read replicas are registered as binds without any table, RoutingSession routes the reads to them
+    replica_binds = {f'replica_{index}': uri for index, uri in
+                     enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS', []))}
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **replica_binds)
+    app.extensions['replica_router'] = ReplicaRouter(replica_binds)
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') and not SQLITE_TRIGRAM:
+        app.logger.warning('SQLite %s has no trigram tokenizer (3.34 or later): the searches scan the tables '
+                           'with LIKE instead of an FTS5 index', sqlite3.sqlite_version)
     db.app = app
     Migrate(app, db)
     db.init_app(app)
 
 
+def insert_all(instances):
+    """
+    insert_all(instances)
+        inserts a list of new models into the database in a single transaction
+        returns the description of every inserted model
+        EXAMPLE
+            new_actors = insert_all([Actor(name=name, birth_date=birth_date, gender=gender, filmography=[])
+                                     for name, birth_date, gender in rows])
+    """
+    try:
+        db.session.add_all(instances)
+        # Flushing assigns the ids, so the models can be described before the commit expires them.
+        db.session.flush()
+        descriptions = [instance.describe() for instance in instances]
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return descriptions
+
+
+def get_change_versions(*table_names):
+    """
+    get_change_versions(*table_names)
+        returns the current change version of each given table, as a tuple in the same order
+        a version changes every time a row of its table is inserted, updated or deleted
+        EXAMPLE
+            actors_version, movies_version = get_change_versions('actors', 'movies')
+    """
+    versions = dict(db.session.query(ChangeVersion.table_name, ChangeVersion.version)
+                    .filter(ChangeVersion.table_name.in_(table_names)))
+    return tuple(versions.get(table_name, 0) for table_name in table_names)
+
+
+def bump_change_versions(connection, table_names):
+    """
+    bump_change_versions(connection, table_names)
+        increments the change version of the given tables, within the transaction of the connection
+    """
+    table_names = sorted(set(table_names))
+    if not table_names:
+        return
+    versions = ChangeVersion.__table__
+    result = connection.execute(versions.update()
+                                .where(versions.c.table_name.in_(table_names))
+                                .values(version=versions.c.version + 1))
+    if result.rowcount != len(table_names):
+        existing = {row.table_name for row in
+                    connection.execute(versions.select().where(versions.c.table_name.in_(table_names)))}
+        connection.execute(versions.insert(), [{'table_name': table_name, 'version': 1}
+                                               for table_name in table_names if table_name not in existing])
+
+
+def mark_changed(session, table_names):
+    """
+    mark_changed(session, table_names)
+        records that the transaction of the session wrote to the given tables, so their change versions are bumped
+        when it commits
+        (called for every flush, and by the writes bypassing the flush, i.e. bulk deletes)
+    """
+    session.info.setdefault('changed_tables', set()).update(table_names)
+    # The following reads of the request must see this write, so they are not sent to a replica anymore
+    session.info['wrote'] = True
+
+
+def record_appearance_writes(session, added=(), removed=()):
+    """
+    record_appearance_writes(session, added=(), removed=())
+        records the (actor_id, movie_id) pairs of the appearances inserted and deleted by the transaction of the
+        session, net of each other, for the co-star index to apply once the transaction commits (see graph.py)
+    """
+    writes = session.info.setdefault('appearance_writes', {'added': set(), 'removed': set()})
+    for pairs, done, undone in ((removed, writes['removed'], writes['added']),
+                                (added, writes['added'], writes['removed'])):
+        for pair in pairs:
+            if pair in undone:
+                undone.discard(pair)
+            else:
+                done.add(pair)
+
+
+@event.listens_for(db.session, 'after_flush')
+def record_flushed_tables(session, flush_context):
+    """
+    Records every table touched by the flush, so any insert/update/delete (cascades and bulk inserts included)
+    invalidates the versions in the same transaction as the write, and the appearances it inserted or deleted.
+    """
+    table_names = {instance.__table__.name for instance in session.new}
+    table_names.update(instance.__table__.name for instance in session.deleted)
+    table_names.update(instance.__table__.name for instance in session.dirty
+                       if session.is_modified(instance, include_collections=False))
+    mark_changed(session, table_names)
+    if 'appearances' in table_names:
+        record_appearance_writes(
+            session,
+            added=[(instance.actor_id, instance.movie_id) for instance in session.new
+                   if isinstance(instance, Appearance)],
+            removed=[(instance.actor_id, instance.movie_id) for instance in session.deleted
+                     if isinstance(instance, Appearance)])
+
+
+@event.listens_for(db.session, 'before_commit')
+def bump_committed_change_versions(session):
+    """
+    Bumps the change versions of the tables written by the transaction in a single statement, right before it
+    commits: the rows of change_versions stay locked for the commit only rather than from the first flush on, and
+    are always locked in the same order, so concurrent writers neither serialize nor deadlock on them.
+    Releasing a SAVEPOINT commits nothing, the versions are bumped by the commit of the enclosing transaction.
+    """
+    if session.in_nested_transaction():
+        return
+    # The commit only flushes the pending changes after this event
+    session.flush()
+    bump_change_versions(session.connection(), session.info.pop('changed_tables', ()))
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def forget_changed_tables(session, transaction):
+    # A rolled back transaction changed nothing
+    if transaction.parent is None:
+        session.info.pop('changed_tables', None)
+        session.info.pop('appearance_writes', None)
+
+
+def search_index_ddl(table_name, column_name, dialect):
+    """
+    search_index_ddl(table_name, column_name, dialect)
+        statements creating the search index of a text column:
+        a trigram GIN index on Postgres, a trigram FTS5 table kept in sync by triggers on SQLite (3.34 at least,
+        no index otherwise)
+    """
+    if dialect == 'postgresql':
+        return [
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+            f'CREATE INDEX IF NOT EXISTS ix_{table_name}_{column_name}_trgm '
+            f'ON {table_name} USING gin ({column_name} gin_trgm_ops)'
+        ]
+    if dialect == 'sqlite' and SQLITE_TRIGRAM:
+        search_table = f'{table_name}_search'
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {search_table} USING fts5({column_name}, "
+            f"content='{table_name}', content_rowid='id', tokenize='trigram')",
+            f'CREATE TRIGGER IF NOT EXISTS {search_table}_insert AFTER INSERT ON {table_name} BEGIN '
+            f'INSERT INTO {search_table}(rowid, {column_name}) VALUES (new.id, new.{column_name}); END',
+            f'CREATE TRIGGER IF NOT EXISTS {search_table}_delete AFTER DELETE ON {table_name} BEGIN '
+            f"INSERT INTO {search_table}({search_table}, rowid, {column_name}) "
+            f"VALUES ('delete', old.id, old.{column_name}); END",
+            f'CREATE TRIGGER IF NOT EXISTS {search_table}_update AFTER UPDATE ON {table_name} BEGIN '
+            f"INSERT INTO {search_table}({search_table}, rowid, {column_name}) "
+            f"VALUES ('delete', old.id, old.{column_name}); "
+            f'INSERT INTO {search_table}(rowid, {column_name}) VALUES (new.id, new.{column_name}); END',
+            f"INSERT INTO {search_table}({search_table}) VALUES ('rebuild')"
+        ]
+    return []
+
+
+def search_query(model, column, text):
+    """
+    search_query(model, column, text)
+        query of the rows of the model whose column contains the text (case insensitive), best matches first
+        it is served by the search index of the column (see search_index_ddl), text must be 3 characters at least
+        EXAMPLE
+            actors = search_query(Actor, Actor.name, 'leo').limit(10).all()
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        pattern = '%' + text.replace('/', '//').replace('%', '/%').replace('_', '/_') + '%'
+        return model.query \
+            .filter(or_(column.ilike(pattern, escape='/'), column.op('%')(text))) \
+            .order_by(func.similarity(column, text).desc(), model.id)
+
+    if dialect == 'sqlite' and SQLITE_TRIGRAM:
+        search_table = table_clause(f'{model.__tablename__}_search', column_clause('rowid'))
+        phrase = '"' + text.replace('"', '""') + '"'
+        matches = select(search_table.c.rowid).where(literal_column(search_table.name).op('MATCH')(phrase))
+        query = model.query.filter(model.id.in_(matches))
+    else:
+        query = model.query.filter(func.lower(column).contains(text.lower(), autoescape=True))
+    # Earliest and then shortest matches first
+    return query.order_by(func.instr(func.lower(column), text.lower()), func.length(column), model.id)
+
+
+def release_year_sql(column, dialect):
+    """
+    release_year_sql(column, dialect)
+        SQL expression of the year of a DateTime column
+    """
+    if dialect == 'postgresql':
+        return f'CAST(EXTRACT(YEAR FROM {column}) AS INTEGER)'
+    # SQLite stores datetimes as 'YYYY-MM-DD HH:MM:SS' text
+    return f'CAST(substr({column}, 1, 4) AS INTEGER)'
+
+
+def filmography_years_sql(actor_id, dialect, aggregate):
+    """
+    filmography_years_sql(actor_id, dialect, aggregate)
+        subquery of the min or max release year of the movies of an actor
+    """
+    return (f'(SELECT {aggregate}({release_year_sql("movies.release_date", dialect)}) FROM appearances '
+            f'JOIN movies ON movies.id = appearances.movie_id WHERE appearances.actor_id = {actor_id})')
+
+
+def counter_ddl(dialect):
+    """
+    counter_ddl(dialect)
+        statements creating the triggers that maintain the summary columns of the actors (appearance_count,
+        first_release_year, last_release_year) and the movies (cast_size) in the transaction of every write to the
+        appearances, whatever issued it: the session, a bulk insert or delete, or a COPY
+        inserts only increment the counters, deletes recompute the release years of the actor from its appearances
+    """
+    if dialect == 'postgresql':
+        year = release_year_sql('release_date', dialect)
+        return [
+            'CREATE OR REPLACE FUNCTION appearances_counters() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+            "IF TG_OP = 'INSERT' THEN "
+            'UPDATE actors SET appearance_count = appearance_count + 1, '
+            'first_release_year = LEAST(first_release_year, movie.year), '
+            'last_release_year = GREATEST(last_release_year, movie.year) '
+            f'FROM (SELECT {year} AS year FROM movies WHERE id = NEW.movie_id) AS movie '
+            'WHERE actors.id = NEW.actor_id; '
+            'UPDATE movies SET cast_size = cast_size + 1 WHERE id = NEW.movie_id; '
+            'RETURN NEW; '
+            'END IF; '
+            'UPDATE actors SET appearance_count = appearance_count - 1, '
+            f"first_release_year = {filmography_years_sql('OLD.actor_id', dialect, 'min')}, "
+            f"last_release_year = {filmography_years_sql('OLD.actor_id', dialect, 'max')} "
+            'WHERE id = OLD.actor_id; '
+            'UPDATE movies SET cast_size = cast_size - 1 WHERE id = OLD.movie_id; '
+            'RETURN OLD; '
+            'END $$',
+            'DROP TRIGGER IF EXISTS appearances_counters ON appearances',
+            'CREATE TRIGGER appearances_counters AFTER INSERT OR DELETE ON appearances '
+            'FOR EACH ROW EXECUTE PROCEDURE appearances_counters()',
+            'CREATE OR REPLACE FUNCTION movies_release_years() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN '
+            f"UPDATE actors SET first_release_year = {filmography_years_sql('actors.id', dialect, 'min')}, "
+            f"last_release_year = {filmography_years_sql('actors.id', dialect, 'max')} "
+            'WHERE id IN (SELECT actor_id FROM appearances WHERE movie_id = NEW.id); '
+            'RETURN NEW; '
+            'END $$',
+            'DROP TRIGGER IF EXISTS movies_release_years ON movies',
+            'CREATE TRIGGER movies_release_years AFTER UPDATE OF release_date ON movies FOR EACH ROW '
+            'WHEN (OLD.release_date IS DISTINCT FROM NEW.release_date) EXECUTE PROCEDURE movies_release_years()'
+        ]
+    if dialect == 'sqlite':
+        year = f"(SELECT {release_year_sql('release_date', dialect)} FROM movies WHERE id = new.movie_id)"
+        return [
+            'CREATE TRIGGER IF NOT EXISTS appearances_counters_insert AFTER INSERT ON appearances BEGIN '
+            'UPDATE actors SET appearance_count = appearance_count + 1, '
+            f'first_release_year = min(coalesce(first_release_year, {year}), {year}), '
+            f'last_release_year = max(coalesce(last_release_year, {year}), {year}) '
+            'WHERE id = new.actor_id; '
+            'UPDATE movies SET cast_size = cast_size + 1 WHERE id = new.movie_id; END',
+            'CREATE TRIGGER IF NOT EXISTS appearances_counters_delete AFTER DELETE ON appearances BEGIN '
+            'UPDATE actors SET appearance_count = appearance_count - 1, '
+            f"first_release_year = {filmography_years_sql('old.actor_id', dialect, 'min')}, "
+            f"last_release_year = {filmography_years_sql('old.actor_id', dialect, 'max')} "
+            'WHERE id = old.actor_id; '
+            'UPDATE movies SET cast_size = cast_size - 1 WHERE id = old.movie_id; END',
+            'CREATE TRIGGER IF NOT EXISTS movies_release_years AFTER UPDATE OF release_date ON movies BEGIN '
+            f"UPDATE actors SET first_release_year = {filmography_years_sql('actors.id', dialect, 'min')}, "
+            f"last_release_year = {filmography_years_sql('actors.id', dialect, 'max')} "
+            'WHERE id IN (SELECT actor_id FROM appearances WHERE movie_id = new.id); END'
+        ]
+    return []
+
+
+def drop_counter_triggers_ddl(dialect):
+    """
+    drop_counter_triggers_ddl(dialect)
+        statements dropping the triggers of counter_ddl fired by the writes to the appearances, for bulk loads
+        that compute the summary columns at once instead (see refresh_counters), counter_ddl creates them again
+    """
+    if dialect == 'postgresql':
+        return ['DROP TRIGGER IF EXISTS appearances_counters ON appearances']
+    if dialect == 'sqlite':
+        return ['DROP TRIGGER IF EXISTS appearances_counters_insert',
+                'DROP TRIGGER IF EXISTS appearances_counters_delete']
+    return []
+
+
+def refresh_counters(connection, first_actor_id=None, first_movie_id=None):
+    """
+    refresh_counters(connection, first_actor_id=None, first_movie_id=None)
+        recomputes the summary columns of the actors and movies from the appearances, in set-based updates
+        to be used after writes that bypassed the triggers of counter_ddl, restricted to the actors and movies
+        from the given ids on if only those were written
+        EXAMPLE
+            refresh_counters(connection, first_actor_id=1000001, first_movie_id=300001)
+    """
+    dialect = connection.dialect.name
+    actors = ('UPDATE actors SET '
+              'appearance_count = (SELECT count(*) FROM appearances WHERE actor_id = actors.id), '
+              f"first_release_year = {filmography_years_sql('actors.id', dialect, 'min')}, "
+              f"last_release_year = {filmography_years_sql('actors.id', dialect, 'max')}")
+    movies = 'UPDATE movies SET cast_size = (SELECT count(*) FROM appearances WHERE movie_id = movies.id)'
+    if first_actor_id is not None:
+        actors += ' WHERE id >= :first_id'
+    if first_movie_id is not None:
+        movies += ' WHERE id >= :first_id'
+    connection.execute(text(actors), {'first_id': first_actor_id})
+    connection.execute(text(movies), {'first_id': first_movie_id})
+
+
 def calculate_current_age(dob):
     """
     Calculates the age of anything given a reference date.
@@ -42,25 +587,62 @@ class Actor(db.Model):
 
     # Autoincrementing, unique primary key
     id = Column(Integer, primary_key=True)
-    name = Column(String(120), nullable=False)
-    birth_date = Column(DateTime(), nullable=False)
+    name = Column(String(120), nullable=False, index=True)
+    birth_date = Column(DateTime(), nullable=False, index=True)
     gender = Column(String(120), nullable=False)
+    # Summary of the filmography, maintained by triggers on the appearances (see counter_ddl). The client-side
+    # default is inserted along the row, so the ORM doesn't expire the column and select it back one row at a time.
+    appearance_count = Column(Integer, nullable=False, default=0, server_default='0', index=True)
+    first_release_year = Column(Integer)
+    last_release_year = Column(Integer)
     filmography = relationship("Appearance", backref=db.backref("actors", lazy=True),
                                cascade="all,delete-orphan")
 
-    def describe(self):
+    # Fields of the representation, and the columns each one is computed from
+    describe_fields = {
+        'id': ('id',),
+        'name': ('name',),
+        'age': ('birth_date',),
+        'gender': ('gender',),
+        'appearance_count': ('appearance_count',),
+        'first_release_year': ('first_release_year',),
+        'last_release_year': ('last_release_year',),
+        'filmography': ()
+    }
+
+    def describe(self, fields=None):
         """
-        describe()
-            representation of the Movie model
+        describe(fields=None)
+            representation of the Actor model, restricted to the given fields (all of them by default)
         """
-        return {
-            'id': self.id,
-            'name': self.name,
-            'age': calculate_current_age(self.birth_date),
-            'gender': self.gender,
-            'filmography': [appearance.movies.title for appearance in
-                            Appearance.query.filter(Appearance.actor_id == self.id).all()]
+        getters = {
+            'id': lambda: self.id,
+            'name': lambda: self.name,
+            'age': lambda: calculate_current_age(self.birth_date),
+            'gender': lambda: self.gender,
+            'appearance_count': lambda: self.appearance_count,
+            'first_release_year': lambda: self.first_release_year,
+            'last_release_year': lambda: self.last_release_year,
+            'filmography': lambda: [appearance.movies.title for appearance in self.filmography]
         }
+        return {field: getters[field]() for field in fields or self.describe_fields}
+
+    @classmethod
+    def describe_query(cls, fields=None):
+        """
+        describe_query(fields=None)
+            query that loads only what describe(fields) needs: the columns of the requested fields and, if
+            requested, the filmography (and its movies) along with the actors, so describing a list of
+            actors takes a fixed number of queries instead of one per actor
+            EXAMPLE
+                actors = [actor.describe(fields) for actor in Actor.describe_query(fields).all()]
+        """
+        fields = fields or cls.describe_fields
+        columns = {'id'}.union(*(cls.describe_fields[field] for field in fields))
+        query = cls.query.options(load_only(*columns))
+        if 'filmography' in fields:
+            query = query.options(selectinload(cls.filmography).joinedload(Appearance.movies))
+        return query
 
     def insert(self):
         """
@@ -106,23 +688,53 @@ class Movie(db.Model):
 
     # Autoincrementing, unique primary key
     id = Column(Integer, primary_key=True)
-    title = Column(String(120), nullable=False)
-    release_date = Column(DateTime(), nullable=False)
+    title = Column(String(120), nullable=False, index=True)
+    release_date = Column(DateTime(), nullable=False, index=True)
+    # Size of the cast, maintained by triggers on the appearances (see counter_ddl), inserted as 0 like
+    # Actor.appearance_count
+    cast_size = Column(Integer, nullable=False, default=0, server_default='0', index=True)
     cast = relationship("Appearance", backref=db.backref("movies", lazy=True),
                         cascade="all,delete-orphan")
 
-    def describe(self):
+    # Fields of the representation, and the columns each one is computed from
+    describe_fields = {
+        'id': ('id',),
+        'title': ('title',),
+        'release_date': ('release_date',),
+        'cast_size': ('cast_size',),
+        'cast': ()
+    }
+
+    def describe(self, fields=None):
         """
-        describe()
-            representation of the Movie model
+        describe(fields=None)
+            representation of the Movie model, restricted to the given fields (all of them by default)
         """
-        return {
-            'id': self.id,
-            'title': self.title,
-            'release_date': self.release_date,
-            'cast': [appearance.actors.name for appearance in
-                     Appearance.query.filter(Appearance.movie_id == self.id).all()]
+        getters = {
+            'id': lambda: self.id,
+            'title': lambda: self.title,
+            'release_date': lambda: self.release_date,
+            'cast_size': lambda: self.cast_size,
+            'cast': lambda: [appearance.actors.name for appearance in self.cast]
         }
+        return {field: getters[field]() for field in fields or self.describe_fields}
+
+    @classmethod
+    def describe_query(cls, fields=None):
+        """
+        describe_query(fields=None)
+            query that loads only what describe(fields) needs: the columns of the requested fields and, if
+            requested, the cast (and its actors) along with the movies, so describing a list of
+            movies takes a fixed number of queries instead of one per movie
+            EXAMPLE
+                movies = [movie.describe(fields) for movie in Movie.describe_query(fields).all()]
+        """
+        fields = fields or cls.describe_fields
+        columns = {'id'}.union(*(cls.describe_fields[field] for field in fields))
+        query = cls.query.options(load_only(*columns))
+        if 'cast' in fields:
+            query = query.options(selectinload(cls.cast).joinedload(Appearance.actors))
+        return query
 
     def insert(self):
         """
@@ -162,7 +774,8 @@ class Movie(db.Model):
 class Appearance(db.Model):
     __tablename__ = 'appearances'
     actor_id = Column(Integer, ForeignKey('actors.id'), primary_key=True)
-    movie_id = Column(Integer, ForeignKey('movies.id'), primary_key=True)
+    # Indexed on its own, as the composite primary key can't serve lookups by movie
+    movie_id = Column(Integer, ForeignKey('movies.id'), primary_key=True, index=True)
 
     def insert(self):
         """
@@ -184,6 +797,38 @@ class Appearance(db.Model):
         db.session.delete(self)
         db.session.commit()
 
+    @classmethod
+    def delete_where(cls, *criteria):
+        """
+        delete_where(*criteria)
+            deletes every appearance matching the criteria in a single DELETE statement, without loading them
+            returns the (actor_id, movie_id) pairs of the deleted appearances
+            EXAMPLE
+                removed = Appearance.delete_where(Appearance.movie_id == movie_id)
+        """
+        try:
+            if db.session.get_bind().dialect.full_returning:
+                pairs = [(actor_id, movie_id) for actor_id, movie_id in db.session.execute(
+                    delete(cls).where(*criteria).returning(cls.actor_id, cls.movie_id)
+                    .execution_options(synchronize_session=False))]
+            else:
+                # The read locks the rows until the DELETE (on SQLite, the transaction of a savepoint takes the write
+                # lock up front), so no appearance committed in between is deleted without being returned
+                with db.session.begin_nested():
+                    pairs = [(actor_id, movie_id) for actor_id, movie_id in
+                             db.session.query(cls.actor_id, cls.movie_id).filter(*criteria).with_for_update()]
+                    if pairs:
+                        cls.query.filter(*criteria).delete(synchronize_session=False)
+            if pairs:
+                # Bulk deletes bypass the flush, so they are recorded here instead of by the flush event
+                mark_changed(db.session, ['appearances'])
+                record_appearance_writes(db.session, removed=pairs)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+        return pairs
+
     def describe(self):
         """
         describe()
@@ -193,3 +838,25 @@ class Appearance(db.Model):
             'movie': {'id': self.movie_id, 'title': self.movies.title},
             'actor': {'id': self.actor_id, 'name': self.actors.name}
         }
+
+
+class ChangeVersion(db.Model):
+    """
+    ChangeVersion
+    a per-table counter incremented on every write, used to validate cached responses cheaply
+    """
+    __tablename__ = 'change_versions'
+    table_name = Column(String(120), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# Search indexes of the actor names and movie titles, also created along with the tables (i.e. by create_all)
+for searchable_table, searchable_column in ((Actor.__table__, 'name'), (Movie.__table__, 'title')):
+    for searchable_dialect in ('postgresql', 'sqlite'):
+        for statement in search_index_ddl(searchable_table.name, searchable_column, searchable_dialect):
+            event.listen(searchable_table, 'after_create', DDL(statement).execute_if(dialect=searchable_dialect))
+
+# Triggers maintaining the summary columns, created along with the appearances table (after the actors and movies)
+for counter_dialect in ('postgresql', 'sqlite'):
+    for statement in counter_ddl(counter_dialect):
+        event.listen(Appearance.__table__, 'after_create', DDL(statement).execute_if(dialect=counter_dialect))
@@ -0,0 +1,120 @@
+import base64
+import json
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import rsa
+from jose import jwt
+from sqlalchemy import event
+
+from app import create_app
+from auth.auth import get_setting, jwks_store, token_cache
+from cache.cache import response_cache
+from graph.graph import costar_index
+from models.models import db
+
+config_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'test_config.py')
+
+CASTING_DIRECTOR = ['get:actors-detail', 'get:movies-detail', 'post:actors', 'post:appearances', 'patch:actors',
+                    'delete:actors']
+EXECUTIVE_PRODUCER = CASTING_DIRECTOR + ['patch:movies', 'post:movies', 'delete:appearances', 'delete:movies']
+
+
+class LocalSigner:
+    """
+    Signs tokens with a local RSA key, whose public part is served to the app as a JWKS through a file:// url,
+    so the tests need neither Auth0 nor tokens from secrets.cfg.
+    """
+    key_id = 'hermetic-tests'
+
+    def __init__(self):
+        # A short key keeps the key generation fast, the tokens never leave the tests
+        _, self.private_key = rsa.newkeys(1024)
+        self.pem = self.private_key.save_pkcs1().decode()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.jwks_file = os.path.join(self.tmp_dir.name, 'jwks.json')
+        with open(self.jwks_file, 'w') as f:
+            json.dump({'keys': [{'kid': self.key_id, 'kty': 'RSA', 'use': 'sig', 'alg': 'RS256',
+                                 'n': self.b64(self.private_key.n), 'e': self.b64(self.private_key.e)}]}, f)
+
+    @staticmethod
+    def b64(number):
+        return base64.urlsafe_b64encode(number.to_bytes((number.bit_length() + 7) // 8, 'big')).rstrip(b'=').decode()
+
+    def install(self):
+        """Points the key store of the app to the local JWKS."""
+        jwks_store.url = Path(self.jwks_file).as_uri()
+        jwks_store.clear()
+
+    def token(self, permissions, expires_in=3600):
+        claims = {'iss': f"https://{get_setting('AUTH0_DOMAIN')}/", 'aud': get_setting('API_AUDIENCE'),
+                  'sub': 'tests|1', 'exp': int(time.time()) + expires_in, 'permissions': permissions}
+        return jwt.encode(claims, self.pem, algorithm='RS256', headers={'kid': self.key_id})
+
+    def auth_header(self, permissions):
+        return ' '.join(('Bearer', self.token(permissions)))
+
+
+_session = {}
+
+
+def session_app():
+    """
+    Creates the app, its schema and the local signer once for the whole test session.
+    The database is the in-memory SQLite of test_config.py, or the one of TEST_DATABASE_URL.
+    """
+    if 'app' not in _session:
+        # Tests never run against the database of the environment
+        os.environ.pop('DATABASE_URL', None)
+        os.environ.pop('DATABASE_REPLICA_URLS', None)
+        app = create_app(config_file)
+        with app.app_context():
+            db.create_all()
+        _session['app'] = app
+        _session['signer'] = LocalSigner()
+    _session['signer'].install()
+    return _session['app'], _session['signer']
+
+
+class HermeticTestCase(unittest.TestCase):
+    """
+    Base of the test cases running against the session app, each test within a transaction rolled back at its end,
+    so the tests leave nothing behind and don't depend on each other.
+    The requests of a test commit to a SAVEPOINT, which is started again after every commit or rollback.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app, cls.signer = session_app()
+
+    def setUp(self):
+        """Start the transaction of the test and bind the sessions of the app to it."""
+        with self.app.app_context():
+            self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        self.savepoint = self.connection.begin_nested()
+        db.session.remove()
+        # Flask-SQLAlchemy binds every table to the engine by default, which would take precedence over the connection
+        db.session.session_factory.configure(bind=self.connection, binds={})
+        event.listen(db.session, 'after_transaction_end', self.restart_savepoint)
+        # The caches outlive the transaction, and the change versions they are validated with are rolled back
+        response_cache.clear()
+        token_cache.clear()
+        costar_index.clear()
+        self.client = self.app.test_client
+
+    def restart_savepoint(self, session, transaction):
+        if not self.savepoint.is_active:
+            self.savepoint = self.connection.begin_nested()
+
+    def tearDown(self):
+        """Roll back everything done by the test."""
+        db.session.remove()
+        event.remove(db.session, 'after_transaction_end', self.restart_savepoint)
+        db.session.session_factory.kw.pop('bind', None)
+        db.session.session_factory.kw.pop('binds', None)
+        self.transaction.rollback()
+        self.connection.close()
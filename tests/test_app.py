@@ -1,33 +1,24 @@
-import configparser
 import json
-import os
 import unittest
+from datetime import datetime
+from unittest import mock
 
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
-from app import create_app
-from models.models import Actor, Appearance, Movie
+from models.models import Actor, Movie, db, get_change_versions, search_index_ddl
+from tests.hermetic import CASTING_DIRECTOR, EXECUTIVE_PRODUCER, HermeticTestCase
 
-secrets = configparser.ConfigParser()
-secrets.read(os.path.join(os.getcwd(), 'auth', 'secrets.cfg'))
-config_file = os.path.join(os.getcwd(), 'config', 'test_config.py')
 
-
-class UnauthorizedTestCase(unittest.TestCase):
+class UnauthorizedTestCase(HermeticTestCase):
     """This class represents the Unauthorized test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app(config_file)
-        self.client = self.app.test_client
+        """Define test variables and start the transaction of the test."""
+        super().setUp()
         self.new_actor = {'name': 'TestActor', 'gender': 'Male', 'birth_date': '2000-01-01'}
         self.patched_actor = {'name': 'TestPatchedActor'}
         self.new_movie = {'title': 'TestMovie', 'release_date': '2000-01-01'}
         self.patched_movie = {'title': 'TestPatchedMovie'}
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
 
     # UN-AUTHORIZED ACTOR TESTS
     def test_unauthorized_get_actors(self):
@@ -105,6 +96,20 @@ class UnauthorizedTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Authorization header was not found.')
 
+    def test_unauthorized_batch(self):
+        res = self.client().post('/batch', json=[{'method': 'GET', 'path': '/actors'}])
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Authorization header was not found.')
+
+    def test_metrics(self):
+        self.client().get('/actors')
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'http_requests_total{endpoint="get_actors",method="GET",status="401"}', res.data)
+        self.assertIn(b'http_request_duration_seconds_bucket{endpoint="get_actors"', res.data)
+
     def test_authorized_delete_appearance(self):
         res = self.client().delete('/appearances', json={'actor_id': 1, 'movie_id': 1})
         data = json.loads(res.data)
@@ -112,29 +117,18 @@ class UnauthorizedTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Authorization header was not found.')
 
-    def tearDown(self):
-        """Executed after all tests"""
-        [appearance.delete() for appearance in Appearance.query.all()]
-        [movie.delete() for movie in Movie.query.all()]
-        [actor.delete() for actor in Actor.query.all()]
 
-
-class ExecutiveProducerTestCase(unittest.TestCase):
+class ExecutiveProducerTestCase(HermeticTestCase):
     """This class represents the ExecutiveProducer test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app(config_file)
-        self.client = self.app.test_client
+        """Define test variables and start the transaction of the test."""
+        super().setUp()
         self.new_actor = {'name': 'TestActor', 'gender': 'Male', 'birth_date': '2000-01-01'}
         self.patched_actor = {'name': 'TestPatchedActor'}
         self.new_movie = {'title': 'TestMovie', 'release_date': '2000-01-01'}
         self.patched_movie = {'title': 'TestPatchedMovie'}
-        self.auth_token = ' '.join(('Bearer', secrets['JWT']['EXECUTIVE_PRODUCER_JWT']))
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
+        self.auth_token = self.signer.auth_header(EXECUTIVE_PRODUCER)
 
     # AUTHORIZED ACTOR TESTS
     def test_authorized_get_actors(self):
@@ -146,6 +140,91 @@ class ExecutiveProducerTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(len(data['actors']) >= 0, True)
 
+    def test_authorized_get_actors_paginated(self):
+        for _ in range(3):
+            self.client().post('/actors',
+                               json=self.new_actor,
+                               headers={'Authorization': self.auth_token})
+
+        res = self.client().get('/actors?limit=2',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['actors']), 2)
+        self.assertEqual(data['next_cursor'], data['actors'][-1]['id'])
+
+        res = self.client().get(f'/actors?limit=2&after={data["next_cursor"]}',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['actors']), 1)
+        self.assertEqual(data['next_cursor'], None)
+
+    def test_authorized_get_actors_invalid_page(self):
+        res = self.client().get('/actors?limit=0',
+                                headers={'Authorization': self.auth_token})
+
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_authorized_get_movies_stream(self):
+        self.client().post('/movies',
+                           json=self.new_movie,
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().get('/movies?stream=ndjson',
+                                headers={'Authorization': self.auth_token})
+        movies = [json.loads(line) for line in res.data.splitlines()]
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(movies[-1]['title'], 'TestMovie')
+
+        res = self.client().get('/movies?stream=json',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['movies']), len(movies))
+
+    def test_authorized_get_actors_fields(self):
+        self.client().post('/actors',
+                           json=self.new_actor,
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().get('/actors?fields=id,name',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data['actors'][0]), {'id', 'name'})
+
+        res = self.client().get('/actors?fields=title',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 422)
+
+    def test_authorized_get_actors_by_age(self):
+        self.client().post('/actors/batch',
+                           json=[dict(self.new_actor, birth_date=birth_date)
+                                 for birth_date in ('1950-01-01', '1980-01-01', '2010-01-01')],
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().get('/actors?age_min=18&age_max=65&fields=id,age',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['actors']), 1)
+        self.assertTrue(18 <= data['actors'][0]['age'] <= 65)
+
+        res = self.client().get('/actors?sort=-age&limit=2&fields=age',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        ages = [actor['age'] for actor in data['actors']]
+        res = self.client().get(f'/actors?sort=-age&limit=2&fields=age&after={data["next_cursor"]}',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        ages += [actor['age'] for actor in data['actors']]
+        self.assertEqual(ages, sorted(ages, reverse=True))
+        self.assertEqual(len(ages), 3)
+
     def test_authorized_post_actor(self):
         res = self.client().post('/actors',
                                  json=self.new_actor,
@@ -197,6 +276,43 @@ class ExecutiveProducerTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(len(data['movies']) >= 0, True)
 
+    def test_authorized_get_movies_not_modified(self):
+        res = self.client().get('/movies',
+                                headers={'Authorization': self.auth_token})
+        etag = res.headers['ETag']
+
+        res = self.client().get('/movies',
+                                headers={'Authorization': self.auth_token, 'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+        self.client().post('/movies',
+                           json=self.new_movie,
+                           headers={'Authorization': self.auth_token})
+        res = self.client().get('/movies',
+                                headers={'Authorization': self.auth_token, 'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_authorized_get_movies_filtered(self):
+        self.client().post('/movies/batch',
+                           json=[self.new_movie, {'title': 'TestNewMovie', 'release_date': '2020-01-01'}],
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().get('/movies?release_date_from=2010-01-01',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([movie['title'] for movie in data['movies']], ['TestNewMovie'])
+
+        res = self.client().get('/movies?title=TestMovie&release_date_to=2010-01-01',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual([movie['title'] for movie in data['movies']], ['TestMovie'])
+
+        res = self.client().get('/movies?release_date_from=yesterday',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 422)
+
     def test_authorized_post_movie(self):
         res = self.client().post('/movies',
                                  json=self.new_movie,
@@ -291,29 +407,448 @@ class ExecutiveProducerTestCase(unittest.TestCase):
         self.assertEqual(data['delete']['actor_id'], actor_id)
         self.assertEqual(data['delete']['movie_id'], movie_id)
 
-    def tearDown(self):
-        """Executed after all tests"""
-        [appearance.delete() for appearance in Appearance.query.all()]
-        [movie.delete() for movie in Movie.query.all()]
-        [actor.delete() for actor in Actor.query.all()]
+    def test_authorized_delete_appearance_by_key(self):
+        res = self.client().post('/actors',
+                                 json=self.new_actor,
+                                 headers={'Authorization': self.auth_token})
+        actor_id = json.loads(res.data)['new_actor']['id']
+        res = self.client().post('/movies/batch',
+                                 json=[dict(self.new_movie, title=title) for title in ('M1', 'M2')],
+                                 headers={'Authorization': self.auth_token})
+        m1, m2 = [movie['id'] for movie in json.loads(res.data)['new_movies']]
+        self.client().post('/appearances/batch',
+                           json=[{'actor_id': actor_id, 'movie_id': m1}, {'actor_id': actor_id, 'movie_id': m2}],
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().delete('/appearances',
+                                   json={'actor_id': actor_id, 'movie_id': m2},
+                                   headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 200)
+        res = self.client().delete('/appearances',
+                                   json={'actor_id': actor_id, 'movie_id': m2},
+                                   headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 404)
+        with self.app.app_context():
+            self.assertEqual([appearance.movie_id for appearance in Actor.query.get(actor_id).filmography], [m1])
+
+    def test_authorized_bulk_delete_appearances(self):
+        res = self.client().post('/actors/batch',
+                                 json=[dict(self.new_actor, name=name) for name in ('A', 'B')],
+                                 headers={'Authorization': self.auth_token})
+        a, b = [actor['id'] for actor in json.loads(res.data)['new_actors']]
+        res = self.client().post('/movies/batch',
+                                 json=[dict(self.new_movie, title=title) for title in ('M1', 'M2', 'M3')],
+                                 headers={'Authorization': self.auth_token})
+        m1, m2, m3 = [movie['id'] for movie in json.loads(res.data)['new_movies']]
+        self.client().post('/appearances/batch',
+                           json=[{'actor_id': actor_id, 'movie_id': movie_id} for actor_id, movie_id in
+                                 ((a, m1), (a, m2), (a, m3), (b, m1), (b, m2))],
+                           headers={'Authorization': self.auth_token})
+        res = self.client().get(f'/actors/{a}/co-stars',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(json.loads(res.data)['co_stars'][0]['shared_movies'], 2)
+
+        res = self.client().delete(f'/actors/{a}/appearances',
+                                   json={'movie_ids': [m1, m3]},
+                                   headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 2)
+
+        res = self.client().delete(f'/movies/{m2}/cast',
+                                   headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 2)
+
+        res = self.client().get(f'/actors/{a}/co-stars',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(json.loads(res.data)['co_stars'], [])
+        res = self.client().get('/actors?name=B&fields=id,appearance_count,filmography',
+                                headers={'Authorization': self.auth_token})
+        actor = next(actor for actor in json.loads(res.data)['actors'] if actor['id'] == b)
+        self.assertEqual(actor, {'id': b, 'appearance_count': 1, 'filmography': ['M1']})
+
+        res = self.client().delete(f'/movies/{m2}/cast',
+                                   json={'actor_ids': 'all'},
+                                   headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 422)
+        res = self.client().delete('/actors/0/appearances',
+                                   headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 404)
+
+    # AUTHORIZED SEARCH TESTS
+    def test_authorized_search(self):
+        self.client().post('/movies/batch',
+                           json=[self.new_movie, {'title': 'Other', 'release_date': '2000-01-01'}],
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().get('/search?q=testmov&type=movies',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([movie['title'] for movie in data['movies']], ['TestMovie'])
+
+        res = self.client().get('/search?q=te',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 422)
+
+    @mock.patch('models.models.SQLITE_TRIGRAM', False)
+    def test_authorized_search_without_trigram(self):
+        self.assertEqual(search_index_ddl('movies', 'title', 'sqlite'), [])
+        self.client().post('/movies/batch',
+                           json=[self.new_movie, {'title': 'Other', 'release_date': '2000-01-01'}],
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().get('/search?q=testmov&type=movies',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([movie['title'] for movie in data['movies']], ['TestMovie'])
+
+    # AUTHORIZED CO-STAR GRAPH TESTS
+    def test_authorized_co_stars_and_path(self):
+        res = self.client().post('/actors/batch',
+                                 json=[dict(self.new_actor, name=name) for name in ('A', 'B', 'C', 'D', 'E')],
+                                 headers={'Authorization': self.auth_token})
+        a, b, c, d, e = [actor['id'] for actor in json.loads(res.data)['new_actors']]
+        res = self.client().post('/movies/batch',
+                                 json=[dict(self.new_movie, title=title) for title in ('M1', 'M2', 'M3', 'M4')],
+                                 headers={'Authorization': self.auth_token})
+        m1, m2, m3, m4 = [movie['id'] for movie in json.loads(res.data)['new_movies']]
+        # A-B-C-D through M1, M2 and M3, and a shortcut A-D through M4 once E is linked
+        self.client().post('/appearances/batch',
+                           json=[{'actor_id': actor_id, 'movie_id': movie_id} for actor_id, movie_id in
+                                 ((a, m1), (b, m1), (b, m2), (c, m2), (c, m3), (d, m3), (a, m4))],
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().get(f'/actors/{b}/co-stars',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual({co_star['id'] for co_star in data['co_stars']}, {a, c})
+
+        res = self.client().get(f'/actors/{a}/path/{d}',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['degrees'], 3)
+        self.assertEqual([actor['id'] for actor in data['actors']], [a, b, c, d])
+        self.assertEqual([movie['title'] for movie in data['movies']], ['M1', 'M2', 'M3'])
+
+        self.client().post('/appearances',
+                           json={'actor_id': d, 'movie_id': m4},
+                           headers={'Authorization': self.auth_token})
+        res = self.client().get(f'/actors/{a}/path/{d}',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(data['degrees'], 1)
+        self.assertEqual([movie['id'] for movie in data['movies']], [m4])
+
+        res = self.client().get(f'/actors/{a}/path/{e}',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 404)
+
+    def test_unauthorized_cached_path(self):
+        res = self.client().post('/actors/batch',
+                                 json=[dict(self.new_actor, name=name) for name in ('A', 'B')],
+                                 headers={'Authorization': self.auth_token})
+        a, b = [actor['id'] for actor in json.loads(res.data)['new_actors']]
+        res = self.client().post('/movies',
+                                 json=self.new_movie,
+                                 headers={'Authorization': self.auth_token})
+        movie_id = json.loads(res.data)['new_movie']['id']
+        self.client().post('/appearances/batch',
+                           json=[{'actor_id': a, 'movie_id': movie_id}, {'actor_id': b, 'movie_id': movie_id}],
+                           headers={'Authorization': self.auth_token})
+        res = self.client().get(f'/actors/{a}/path/{b}',
+                                headers={'Authorization': self.auth_token})
+        etag = res.headers['ETag']
+
+        # Neither the cached response nor the 304 may reveal the path without the movies permission
+        auth_token = self.signer.auth_header(['get:actors-detail'])
+        res = self.client().get(f'/actors/{a}/path/{b}',
+                                headers={'Authorization': auth_token})
+        self.assertEqual(res.status_code, 401)
+        res = self.client().get(f'/actors/{a}/path/{b}',
+                                headers={'Authorization': auth_token, 'If-None-Match': etag})
+        self.assertEqual(res.status_code, 401)
+
+    def seed_catalog(self, size):
+        """Create size actors and movies, each actor appearing in two of the movies."""
+        res = self.client().post('/actors/batch',
+                                 json=[self.new_actor] * size,
+                                 headers={'Authorization': self.auth_token})
+        actor_ids = [actor['id'] for actor in json.loads(res.data)['new_actors']]
+        res = self.client().post('/movies/batch',
+                                 json=[self.new_movie] * size,
+                                 headers={'Authorization': self.auth_token})
+        movie_ids = [movie['id'] for movie in json.loads(res.data)['new_movies']]
+        res = self.client().post('/appearances/batch',
+                                 json=[{'actor_id': actor_id, 'movie_id': movie_ids[(index + shift) % size]}
+                                       for index, actor_id in enumerate(actor_ids) for shift in (0, 1)],
+                                 headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 200)
+
+    def count_statements(self, path):
+        """Count the SQL statements run to answer a GET request."""
+        statements = []
 
+        def count(connection, cursor, statement, parameters, context, executemany):
+            # Leaving out the SAVEPOINTs of the test transaction
+            if not statement.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+                statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'after_cursor_execute', count)
+        try:
+            res = self.client().get(path, headers={'Authorization': self.auth_token})
+        finally:
+            event.remove(engine, 'after_cursor_execute', count)
+        self.assertEqual(res.status_code, 200)
+        return len(statements)
+
+    def test_authorized_list_statements(self):
+        # The filmography and cast of a page are loaded at once, whatever the number of rows of the page
+        self.seed_catalog(2)
+        counts = {path: self.count_statements(path) for path in ('/actors', '/movies')}
+        self.seed_catalog(20)
+        for path, count in counts.items():
+            self.assertEqual(self.count_statements(path), count, path)
+        self.assertLessEqual(max(counts.values()), 3)
+
+    def test_authorized_summary_columns(self):
+        res = self.client().post('/actors/batch',
+                                 json=[dict(self.new_actor, name=name) for name in ('A', 'B', 'C')],
+                                 headers={'Authorization': self.auth_token})
+        a, b, c = [actor['id'] for actor in json.loads(res.data)['new_actors']]
+        res = self.client().post('/movies/batch',
+                                 json=[dict(self.new_movie, release_date=release_date)
+                                       for release_date in ('1990-01-01', '2005-06-01')],
+                                 headers={'Authorization': self.auth_token})
+        m1, m2 = [movie['id'] for movie in json.loads(res.data)['new_movies']]
+        self.client().post('/appearances/batch',
+                           json=[{'actor_id': actor_id, 'movie_id': movie_id} for actor_id, movie_id in
+                                 ((a, m1), (a, m2), (b, m2))],
+                           headers={'Authorization': self.auth_token})
+
+        res = self.client().get('/actors?sort=appearance_count&limit=3'
+                                '&fields=id,appearance_count,first_release_year,last_release_year',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['actors'][0], {'id': a, 'appearance_count': 2,
+                                             'first_release_year': 1990, 'last_release_year': 2005})
+        self.assertEqual(data['actors'][1]['id'], b)
+        self.assertEqual([actor['appearance_count'] for actor in data['actors']], [2, 1, 0])
+
+        res = self.client().get('/movies?sort=-cast_size&limit=1&fields=id,cast_size',
+                                headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        res = self.client().get(f'/movies?sort=-cast_size&limit=1&fields=id,cast_size&after={data["next_cursor"]}',
+                                headers={'Authorization': self.auth_token})
+        sizes = [movie['cast_size'] for movie in data['movies'] + json.loads(res.data)['movies']]
+        self.assertEqual(sizes, sorted(sizes))
+
+        # Moving or deleting a movie updates the release years of its cast
+        with self.app.app_context():
+            movie = Movie.query.get(m2)
+            movie.release_date = datetime(1980, 1, 1)
+            movie.update()
+        self.client().delete(f'/movies/{m1}',
+                             headers={'Authorization': self.auth_token})
+        res = self.client().get(f'/actors?name=A&fields=id,appearance_count,first_release_year,last_release_year',
+                                headers={'Authorization': self.auth_token})
+        actor = next(actor for actor in json.loads(res.data)['actors'] if actor['id'] == a)
+        self.assertEqual(actor, {'id': a, 'appearance_count': 1, 'first_release_year': 1980, 'last_release_year': 1980})
+        with self.app.app_context():
+            self.assertEqual(Movie.query.get(m2).cast_size, 2)
+            self.assertEqual(Actor.query.get(c).last_release_year, None)
+
+    # AUTHORIZED BATCH TESTS
+    def test_authorized_post_batches(self):
+        res = self.client().post('/actors/batch',
+                                 json=[self.new_actor, self.new_actor],
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['new_actors']), 2)
+        actor_ids = [actor['id'] for actor in data['new_actors']]
+
+        res = self.client().post('/movies/batch',
+                                 json=[self.new_movie],
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['new_movies'][0]['title'], 'TestMovie')
+        movie_id = data['new_movies'][0]['id']
+
+        res = self.client().post('/appearances/batch',
+                                 json=[{'actor_id': actor_id, 'movie_id': movie_id} for actor_id in actor_ids],
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([appearance['actor']['id'] for appearance in data['new_appearances']], actor_ids)
 
-class CastingDirectorTestCase(unittest.TestCase):
+    def test_authorized_post_invalid_batch(self):
+        res = self.client().post('/actors/batch',
+                                 json=[self.new_actor, {'name': 'TestActor'}],
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['errors'][0]['index'], 1)
+        with self.app.app_context():
+            self.assertEqual(Actor.query.count(), 0)
+
+        res = self.client().post('/actors/batch',
+                                 json=[dict(self.new_actor, name=None), dict(self.new_actor, gender='x' * 121),
+                                       self.new_actor],
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['errors'], [{'index': 0, 'message': 'Invalid name.'},
+                                          {'index': 1, 'message': 'Invalid gender.'}])
+
+        res = self.client().post('/movies/batch',
+                                 json=[self.new_movie, dict(self.new_movie, title=42)],
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['errors'], [{'index': 1, 'message': 'Invalid title.'}])
+
+        res = self.client().post('/actors', json=self.new_actor, headers={'Authorization': self.auth_token})
+        actor_id = json.loads(res.data)['new_actor']['id']
+        res = self.client().post('/movies', json=self.new_movie, headers={'Authorization': self.auth_token})
+        movie_id = json.loads(res.data)['new_movie']['id']
+        # Floats, bools and numeric strings are not ids, even though int() would take them
+        res = self.client().post('/appearances/batch',
+                                 json=[{'actor_id': float(actor_id), 'movie_id': movie_id},
+                                       {'actor_id': actor_id, 'movie_id': True},
+                                       {'actor_id': str(actor_id), 'movie_id': movie_id},
+                                       [actor_id, movie_id],
+                                       {'actor_id': actor_id, 'movie_id': movie_id}],
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['errors'], [{'index': index, 'message': 'Missing or invalid actor_id or movie_id.'}
+                                          for index in range(4)])
+
+    # AUTHORIZED MULTIPLEXED REQUEST TESTS
+    def test_authorized_batch_operations(self):
+        operations = [
+            {'method': 'POST', 'path': '/movies', 'body': self.new_movie},
+            {'method': 'POST', 'path': '/actors', 'body': self.new_actor},
+            {'method': 'POST', 'path': '/appearances',
+             'body': {'actor_id': '$1.new_actor.id', 'movie_id': '$0.new_movie.id'}},
+            {'method': 'GET', 'path': '/actors?name=TestActor&fields=id,appearance_count,filmography'},
+            {'method': 'PATCH', 'path': '/actors/$1.new_actor.id', 'body': self.patched_actor}
+        ]
+        with self.app.app_context():
+            versions = get_change_versions('actors', 'movies', 'appearances')
+        res = self.client().post('/batch',
+                                 json=operations,
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        actor_id = data['results'][1]['new_actor']['id']
+        self.assertEqual(data['results'][3]['actors'], [{'id': actor_id, 'appearance_count': 1,
+                                                         'filmography': ['TestMovie']}])
+        # The versions are bumped once by the commit of the batch, not by each of its operations
+        with self.app.app_context():
+            self.assertEqual(get_change_versions('actors', 'movies', 'appearances'),
+                             tuple(version + 1 for version in versions))
+
+        res = self.client().get(f'/actors/{actor_id}/co-stars',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 200)
+
+    def test_authorized_batch_is_atomic(self):
+        operations = [
+            {'method': 'POST', 'path': '/actors', 'body': self.new_actor},
+            {'method': 'PATCH', 'path': '/actors/$0.new_actor.id', 'body': self.patched_actor},
+            {'method': 'DELETE', 'path': '/movies/0'}
+        ]
+        with self.app.app_context():
+            versions = get_change_versions('actors')
+        res = self.client().post('/batch',
+                                 json=operations,
+                                 headers={'Authorization': self.auth_token})
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['index'], 2)
+        with self.app.app_context():
+            self.assertEqual(Actor.query.count(), 0)
+            self.assertEqual(get_change_versions('actors'), versions)
+
+        res = self.client().post('/batch',
+                                 json=[{'method': 'GET', 'path': '/actors/$3.new_actor.id/co-stars'}],
+                                 headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 422)
+        res = self.client().post('/batch',
+                                 json=[{'method': 'POST', 'path': '/batch', 'body': operations}],
+                                 headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 422)
+
+    def test_authorized_batch_co_stars(self):
+        res = self.client().post('/actors/batch',
+                                 json=[dict(self.new_actor, name=name) for name in ('A', 'B')],
+                                 headers={'Authorization': self.auth_token})
+        a, b = [actor['id'] for actor in json.loads(res.data)['new_actors']]
+        res = self.client().post('/movies',
+                                 json=self.new_movie,
+                                 headers={'Authorization': self.auth_token})
+        movie_id = json.loads(res.data)['new_movie']['id']
+        self.client().post('/appearances',
+                           json={'actor_id': a, 'movie_id': movie_id},
+                           headers={'Authorization': self.auth_token})
+        res = self.client().get(f'/actors/{a}/co-stars',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(json.loads(res.data)['co_stars'], [])
+
+        # The appearance of the failing batch is rolled back, and never reaches the index
+        res = self.client().post('/batch',
+                                 json=[{'method': 'POST', 'path': '/appearances',
+                                        'body': {'actor_id': b, 'movie_id': movie_id}},
+                                       {'method': 'DELETE', 'path': '/movies/0'}],
+                                 headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 404)
+        res = self.client().get('/health')
+        self.assertEqual(json.loads(res.data)['costar_index']['overlay'], 0)
+        res = self.client().get(f'/actors/{a}/co-stars',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual(json.loads(res.data)['co_stars'], [])
+
+        # The appearance of a successful batch is applied once committed, keeping the index in step
+        res = self.client().post('/batch',
+                                 json=[{'method': 'POST', 'path': '/appearances',
+                                        'body': {'actor_id': b, 'movie_id': movie_id}}],
+                                 headers={'Authorization': self.auth_token})
+        self.assertEqual(res.status_code, 200)
+        res = self.client().get('/health')
+        stats = json.loads(res.data)['costar_index']
+        with self.app.app_context():
+            self.assertEqual(stats['version'], get_change_versions('appearances')[0])
+        self.assertEqual(stats['overlay'], 1)
+        res = self.client().get(f'/actors/{a}/co-stars',
+                                headers={'Authorization': self.auth_token})
+        self.assertEqual([co_star['id'] for co_star in json.loads(res.data)['co_stars']], [b])
+
+
+class CastingDirectorTestCase(HermeticTestCase):
     """This class represents the CastingDirector test case"""
 
     def setUp(self):
-        """Define test variables and initialize app."""
-        self.app = create_app(config_file)
-        self.client = self.app.test_client
+        """Define test variables and start the transaction of the test."""
+        super().setUp()
         self.new_actor = {'name': 'TestActor', 'gender': 'Male', 'birth_date': '2000-01-01'}
         self.patched_actor = {'name': 'TestPatchedActor'}
         self.new_movie = {'title': 'TestMovie', 'release_date': '2000-01-01'}
         self.patched_movie = {'title': 'TestPatchedMovie'}
-        self.auth_token = ' '.join(('Bearer', secrets['JWT']['CASTING_DIRECTOR_JWT']))
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
+        self.auth_token = self.signer.auth_header(CASTING_DIRECTOR)
 
     # AUTHORIZED ACTOR TESTS
     def test_authorized_get_actors(self):
@@ -414,8 +949,10 @@ class CastingDirectorTestCase(unittest.TestCase):
         data = json.loads(res.data)
         actor_id = data['new_actor']['id']
 
-        Movie(title=self.new_movie['title'], release_date=self.new_movie['release_date']).insert()
-        movie_id = Movie.query.first().id
+        with self.app.app_context():
+            Movie(title=self.new_movie['title'],
+                  release_date=datetime.strptime(self.new_movie['release_date'], '%Y-%m-%d')).insert()
+            movie_id = Movie.query.first().id
 
         res = self.client().post('/appearances',
                                  json={'actor_id': actor_id, 'movie_id': movie_id},
@@ -440,11 +977,20 @@ class CastingDirectorTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Permission not found.')
 
-    def tearDown(self):
-        """Executed after all tests"""
-        [appearance.delete() for appearance in Appearance.query.all()]
-        [movie.delete() for movie in Movie.query.all()]
-        [actor.delete() for actor in Actor.query.all()]
+    def test_unauthorized_batch_operation(self):
+        operations = [{'method': 'POST', 'path': '/actors', 'body': self.new_actor},
+                      {'method': 'POST', 'path': '/movies', 'body': self.new_movie}]
+        res = self.client().post('/batch',
+                                 json=operations,
+                                 headers={'Authorization': self.auth_token})
+
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Permission not found.')
+        self.assertEqual(data['index'], 1)
+        with self.app.app_context():
+            self.assertEqual(Actor.query.count(), 0)
 
 
 # Make the tests conveniently executable
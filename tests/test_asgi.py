@@ -0,0 +1,65 @@
+import asyncio
+import unittest
+
+import httpx
+from flask import Response
+
+import tests.test_app as app_tests
+from asgi import create_asgi_app
+
+
+class ASGITestClient:
+    """
+    Sends the requests of a test through the ASGI entry point of the app, with the interface of the Flask test client
+    used by the app tests.
+    """
+
+    def __init__(self, wsgi_app):
+        self.asgi_app = create_asgi_app(wsgi_app)
+
+    def open(self, method, path, json=None, headers=None):
+        async def send():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=self.asgi_app),
+                                         base_url='http://localhost') as client:
+                return await client.request(method, path, json=json, headers=headers)
+
+        response = asyncio.run(send())
+        return Response(response.content, status=response.status_code, headers=list(response.headers.items()))
+
+    def get(self, path, **kwargs):
+        return self.open('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open('POST', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.open('PATCH', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.open('DELETE', path, **kwargs)
+
+
+class ASGITestCase:
+    """Runs the app tests of the test case it is mixed in through the ASGI entry point."""
+
+    def setUp(self):
+        super().setUp()
+        client = ASGITestClient(self.app)
+        self.client = lambda: client
+
+
+class ASGIUnauthorizedTestCase(ASGITestCase, app_tests.UnauthorizedTestCase):
+    pass
+
+
+class ASGIExecutiveProducerTestCase(ASGITestCase, app_tests.ExecutiveProducerTestCase):
+    pass
+
+
+class ASGICastingDirectorTestCase(ASGITestCase, app_tests.CastingDirectorTestCase):
+    pass
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
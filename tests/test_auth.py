@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from auth.auth import AuthError, JWKSKeyStore, VerifiedTokenCache, get_jwks_url, get_setting
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """This class represents the JWKS key store test case"""
+
+    def setUp(self):
+        """Write a local JWKS document and point a fresh key store at it."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.jwks_file = os.path.join(self.tmp_dir.name, 'jwks.json')
+        self.write_jwks('key-1')
+        self.store = JWKSKeyStore(Path(self.jwks_file).as_uri(), default_ttl=60, refresh_cooldown=60)
+
+    def write_jwks(self, *kids):
+        with open(self.jwks_file, 'w') as f:
+            json.dump({'keys': [{'kid': kid, 'kty': 'RSA', 'use': 'sig', 'n': 'n', 'e': 'AQAB'}
+                                for kid in kids]}, f)
+
+    def test_key_set_is_cached(self):
+        self.assertEqual(self.store.get_key('key-1')['kid'], 'key-1')
+        os.remove(self.jwks_file)
+        self.assertEqual(self.store.get_key('key-1')['kid'], 'key-1')
+
+    def test_unknown_kid_forces_refresh(self):
+        self.store.refresh_cooldown = 0
+        self.store.get_key('key-1')
+        self.write_jwks('key-1', 'key-2')
+        self.assertEqual(self.store.get_key('key-2')['kid'], 'key-2')
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        self.store.get_key('key-1')
+        self.write_jwks('key-1', 'key-2')
+        self.assertIsNone(self.store.get_key('key-2'))
+
+    def test_stale_key_set_is_served_while_revalidating(self):
+        self.store.get_key('key-1')
+        self.store._expires_at = time.monotonic() - 1
+        os.remove(self.jwks_file)
+        self.assertEqual(self.store.get_key('key-1')['kid'], 'key-1')
+
+    def test_unavailable_key_set(self):
+        os.remove(self.jwks_file)
+        with self.assertRaises(AuthError) as context:
+            self.store.get_key('key-1')
+        self.assertEqual(context.exception.status_code, 503)
+
+    def test_failed_fetch_is_shared_and_rate_limited(self):
+        def unreachable(url, timeout):
+            time.sleep(0.2)
+            raise OSError('unreachable')
+
+        errors = []
+
+        def get_key():
+            try:
+                self.store.get_key('key-1')
+            except AuthError as error:
+                errors.append(error.status_code)
+
+        with mock.patch('auth.auth.urlopen', side_effect=unreachable) as urlopen:
+            threads = [threading.Thread(target=get_key) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(urlopen.call_count, 1)
+            self.assertEqual(errors, [503] * 8)
+
+            # Within the cooldown, the requests fail fast without fetching again
+            get_key()
+            self.assertEqual(urlopen.call_count, 1)
+
+    def tearDown(self):
+        """Executed after all tests"""
+        self.tmp_dir.cleanup()
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    def setUp(self):
+        """Create a small token cache."""
+        self.cache = VerifiedTokenCache(max_entries=2, max_ttl=60)
+        self.payload = {'sub': 'user', 'exp': time.time() + 3600, 'permissions': []}
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get('token'))
+        self.cache.set('token', self.payload)
+        self.assertEqual(self.cache.get('token'), self.payload)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_expired_token_is_not_served(self):
+        self.cache.set('token', dict(self.payload, exp=time.time() - 1))
+        self.assertIsNone(self.cache.get('token'))
+
+    def test_token_without_exp_is_not_cached(self):
+        self.cache.set('token', {'sub': 'user'})
+        self.assertIsNone(self.cache.get('token'))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('token-1', self.payload)
+        self.cache.set('token-2', self.payload)
+        self.cache.get('token-1')
+        self.cache.set('token-3', self.payload)
+        self.assertIsNone(self.cache.get('token-2'))
+        self.assertIsNotNone(self.cache.get('token-1'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+
+class SettingsTestCase(unittest.TestCase):
+    """This class represents the lazily loaded auth settings test case"""
+
+    def test_environment_overrides_secrets(self):
+        with mock.patch.dict(os.environ, {'API_AUDIENCE': 'TestAudience', 'AUTH0_DOMAIN': 'test.auth0.com'}):
+            self.assertEqual(get_setting('API_AUDIENCE'), 'TestAudience')
+            self.assertEqual(get_jwks_url(), 'https://test.auth0.com/.well-known/jwks.json')
+
+    def test_missing_setting(self):
+        with self.assertRaises(AuthError) as context:
+            get_setting('TEST_MISSING_SETTING')
+        self.assertEqual(context.exception.status_code, 500)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from cache.cache import ResponseCache
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    """This class represents the response cache test case"""
+
+    def setUp(self):
+        """Create a small response cache."""
+        self.cache = ResponseCache(max_bytes=10, max_entry_bytes=6)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get('/actors', 'v1'))
+        self.cache.set('/actors', 'v1', b'body', 'application/json')
+        self.assertEqual(self.cache.get('/actors', 'v1'), (b'body', 'application/json'))
+        self.assertEqual(self.cache.stats()['hit_ratio'], 0.5)
+
+    def test_new_version_invalidates_entry(self):
+        self.cache.set('/actors', 'v1', b'body', 'application/json')
+        self.assertIsNone(self.cache.get('/actors', 'v2'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+        self.assertEqual(self.cache.stats()['bytes'], 0)
+
+    def test_size_bound(self):
+        self.cache.set('/actors', 'v1', b'12345', 'application/json')
+        self.cache.set('/movies', 'v1', b'12345', 'application/json')
+        self.cache.set('/actors?limit=1', 'v1', b'12345', 'application/json')
+        self.cache.set('/movies?limit=1', 'v1', b'1234567', 'application/json')
+        self.assertIsNone(self.cache.get('/actors', 'v1'))
+        self.assertIsNone(self.cache.get('/movies?limit=1', 'v1'))
+        self.assertEqual(self.cache.stats()['bytes'], 10)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
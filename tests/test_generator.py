@@ -0,0 +1,64 @@
+import unittest
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.pool import StaticPool
+
+from generator.generator import generate_catalog
+from models.models import Actor, Appearance, Movie, db
+
+
+class GeneratorTestCase(unittest.TestCase):
+    """This class represents the synthetic catalog generator test case"""
+
+    def generate(self, seed=0, actors=2000, movies=500):
+        """Generate a catalog into an in-memory database of its own, and return its engine."""
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        db.Model.metadata.create_all(engine)
+        counts = generate_catalog(engine, actors, movies, seed=seed, log=lambda message: None)
+        self.assertEqual(counts['actors'], actors)
+        self.assertEqual(counts['movies'], movies)
+        self.assertGreater(counts['appearances'], movies)
+        return engine
+
+    @staticmethod
+    def rows(engine):
+        with engine.connect() as connection:
+            return [connection.execute(select(table).order_by(*table.primary_key)).fetchall()
+                    for table in (Actor.__table__, Movie.__table__, Appearance.__table__)]
+
+    def test_same_seed_same_catalog(self):
+        self.assertEqual(self.rows(self.generate(seed=42)), self.rows(self.generate(seed=42)))
+        self.assertNotEqual(self.rows(self.generate(seed=42)), self.rows(self.generate(seed=43)))
+
+    def test_counters(self):
+        engine = self.generate()
+        appearances = Appearance.__table__
+        with engine.connect() as connection:
+            appearance_counts = dict(connection.execute(
+                select(appearances.c.actor_id, func.count()).group_by(appearances.c.actor_id)).fetchall())
+            cast_sizes = dict(connection.execute(
+                select(appearances.c.movie_id, func.count()).group_by(appearances.c.movie_id)).fetchall())
+            actors = connection.execute(select(Actor.__table__.c.id, Actor.__table__.c.appearance_count)).fetchall()
+            movies = connection.execute(select(Movie.__table__.c.id, Movie.__table__.c.cast_size)).fetchall()
+        self.assertEqual(len(actors), 2000)
+        self.assertEqual(len(movies), 500)
+        for actor_id, appearance_count in actors:
+            self.assertEqual(appearance_count, appearance_counts.get(actor_id, 0))
+        for movie_id, cast_size in movies:
+            self.assertEqual(cast_size, cast_sizes.get(movie_id, 0))
+
+    def test_triggers_restored(self):
+        engine = self.generate(actors=20, movies=5)
+        with engine.begin() as connection:
+            actor_id = connection.execute(select(func.max(Actor.__table__.c.id))).scalar()
+            movie_id = connection.execute(select(func.max(Movie.__table__.c.id))).scalar()
+            connection.execute(Appearance.__table__.delete().where(Appearance.__table__.c.movie_id == movie_id))
+            connection.execute(Appearance.__table__.insert(), {'actor_id': actor_id, 'movie_id': movie_id})
+            cast_size = connection.execute(
+                select(Movie.__table__.c.cast_size).where(Movie.__table__.c.id == movie_id)).scalar()
+        self.assertEqual(cast_size, 1)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
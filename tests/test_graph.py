@@ -0,0 +1,53 @@
+import unittest
+from unittest import mock
+
+from graph.graph import Adjacency, CoStarIndex
+
+
+class CoStarIndexTestCase(unittest.TestCase):
+    """This class represents the co-star index test case"""
+
+    def setUp(self):
+        """Create an index over two actors of one movie, at version 1, without the database."""
+        self.index = CoStarIndex()
+        self.index._adjacency = Adjacency([(1, 1), (2, 1)])
+        self.index._version = 1
+
+    def test_overlay(self):
+        self.index.apply(2, added=[(5, 1)], removed=[(2, 1)])
+        self.assertEqual(self.index.co_stars(1), {5: 1})
+        self.assertEqual(self.index.shortest_path(5, 1), ([5, 1], [1]))
+        self.assertEqual(self.index.stats()['version'], 2)
+
+    @mock.patch('graph.graph.OVERLAY_MIN_EDGES', 0)
+    def test_compaction_keeps_new_actors(self):
+        self.index.apply(2, added=[(5, 1), (6, 2)])
+        self.assertEqual(self.index.stats()['overlay'], 0)
+        self.assertEqual(self.index.co_stars(1), {2: 1, 5: 1})
+        self.assertEqual(self.index.co_stars(5), {1: 1, 2: 1})
+        self.assertEqual(self.index.co_stars(6), {})
+
+    def test_apply_after_refresh(self):
+        # A refresh of another request already loaded the committed appearance (2, 1), at version 2
+        with mock.patch('graph.graph.get_change_versions', return_value=(2,)), \
+                mock.patch('graph.graph.primary_reads'), mock.patch('graph.graph.db') as db:
+            db.session.query.return_value.yield_per.return_value = [(1, 1), (2, 1)]
+            self.index.refresh()
+        self.assertEqual(self.index.stats()['version'], 2)
+
+        self.index.apply(2, added=[(2, 1)])
+        self.assertEqual(self.index.co_stars(1), {2: 1})
+        self.assertEqual(self.index.stats()['overlay'], 0)
+        # Not in step anymore, so the next read rebuilds the index
+        self.assertIsNone(self.index.stats()['version'])
+
+    def test_apply_out_of_step(self):
+        self.index.apply(2, added=[(5, 1)])
+        self.index.apply(4, removed=[(5, 1)])
+        self.assertIsNone(self.index.stats()['version'])
+        self.assertEqual(self.index.co_stars(1), {2: 1, 5: 1})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
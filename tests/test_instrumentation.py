@@ -0,0 +1,68 @@
+import io
+import json
+import os
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
+from unittest import mock
+
+from app import create_app
+from cache.cache import response_cache
+from models.models import Actor, Appearance, Movie, db
+from tests.hermetic import CASTING_DIRECTOR, config_file, session_app
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    """This class represents the request instrumentation test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Create an instrumented app, on an in-memory database of its own holding an actor with a movie."""
+        _, cls.signer = session_app()
+        environ = {'INSTRUMENTATION': '1', 'QUERY_BUDGET': '2'}
+        with mock.patch.dict(os.environ, environ):
+            os.environ.pop('DATABASE_URL', None)
+            os.environ.pop('DATABASE_REPLICA_URLS', None)
+            cls.app = create_app(config_file)
+        with cls.app.app_context():
+            db.create_all()
+            actor = Actor(name='TestActor', gender='Male', birth_date=datetime(2000, 1, 1))
+            movie = Movie(title='TestMovie', release_date=datetime(2000, 1, 1))
+            db.session.add_all([actor, movie, Appearance(actors=actor, movies=movie)])
+            db.session.commit()
+
+    def setUp(self):
+        """Answer every request from the database."""
+        response_cache.clear()
+
+    def get(self, path):
+        """Send a GET request, and return its response along with the JSON log line of the request."""
+        output = io.StringIO()
+        with redirect_stdout(output):
+            res = self.app.test_client().get(path,
+                                             headers={'Authorization': self.signer.auth_header(CASTING_DIRECTOR)})
+        return res, json.loads(output.getvalue().strip().splitlines()[-1])
+
+    def test_server_timing(self):
+        res, log = self.get('/actors')
+        self.assertEqual(res.status_code, 200)
+        timings = {timing.split(';')[0]: timing for timing in res.headers['Server-Timing'].split(', ')}
+        self.assertEqual(set(timings), {'auth', 'db', 'app', 'total'})
+        self.assertIn(f'desc="{log["queries"]} queries"', timings['db'])
+
+    def test_log_line(self):
+        res, log = self.get('/actors')
+        self.assertEqual(log['endpoint'], 'get_actors')
+        self.assertEqual(log['status'], 200)
+        # The change versions of the ETag, the actors and their filmography
+        self.assertEqual(log['queries'], 3)
+        self.assertTrue(log['over_query_budget'])
+
+        res, log = self.get('/health')
+        self.assertEqual(log['queries'], 0)
+        self.assertNotIn('over_query_budget', log)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+from app import create_app
+from models.models import POOL_DEFAULTS, InstrumentedQueuePool, engine_options, pool_stats
+from tests.hermetic import HermeticTestCase, config_file
+
+
+class EngineOptionsTestCase(unittest.TestCase):
+    """This class represents the connection pool settings test case"""
+
+    def config(self, database_uri, **settings):
+        return dict(POOL_DEFAULTS, SQLALCHEMY_DATABASE_URI=database_uri, **settings)
+
+    def test_defaults(self):
+        options = engine_options(self.config('postgresql://localhost/movie_casting'))
+        self.assertEqual(options, {
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': 5,
+            'max_overflow': 10,
+            'pool_timeout': 30,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True
+        })
+
+    def test_statement_timeout(self):
+        options = engine_options(self.config('postgresql://localhost/movie_casting', DB_STATEMENT_TIMEOUT=5000))
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=5000'})
+
+    def test_sqlite_pool(self):
+        options = engine_options(self.config('sqlite://', DB_POOL_SIZE=20))
+        self.assertEqual(options, {'pool_recycle': 1800, 'pool_pre_ping': True})
+
+    def test_environment_overrides(self):
+        environ = {'DB_POOL_SIZE': '20', 'DB_POOL_RECYCLE': '60', 'DB_POOL_PRE_PING': 'false'}
+        with mock.patch.dict(os.environ, environ):
+            os.environ.pop('DATABASE_URL', None)
+            os.environ.pop('DATABASE_REPLICA_URLS', None)
+            app = create_app(config_file)
+        self.assertEqual(app.config['DB_POOL_SIZE'], 20)
+        self.assertEqual(app.config['DB_MAX_OVERFLOW'], POOL_DEFAULTS['DB_MAX_OVERFLOW'])
+        self.assertEqual(app.config['SQLALCHEMY_ENGINE_OPTIONS'], {'pool_recycle': 60, 'pool_pre_ping': False})
+
+
+class PoolStatsTestCase(unittest.TestCase):
+    """This class represents the connection pool stats test case"""
+
+    def test_instrumented_pool_stats(self):
+        pool = InstrumentedQueuePool(mock.Mock, pool_size=2, max_overflow=1)
+        pool.connect().close()
+        with mock.patch('models.models.db') as db:
+            db.engine.pool = pool
+            stats = pool_stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['max_overflow'], 1)
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertGreaterEqual(stats['wait_time_max'], 0)
+
+
+class HealthTestCase(HermeticTestCase):
+    """This class represents the health endpoint test case"""
+
+    def test_health(self):
+        res = self.client().get('/health')
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        # SQLite has a pool of its own, without a size
+        self.assertIn('status', data['pool'])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from app import create_app
+from graph.graph import costar_index
+from models.models import Actor, Appearance, Movie, db, get_change_versions, primary_reads
+
+
+class ReadReplicaTestCase(unittest.TestCase):
+    """This class represents the read replica routing test case, on a primary and two replica SQLite databases"""
+
+    def setUp(self):
+        """Create the three databases, each one with a single actor named after it."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        paths = {name: 'sqlite:///' + os.path.join(self.tmp_dir.name, f'{name}.db')
+                 for name in ('primary', 'replica_0', 'replica_1')}
+        config_file = os.path.join(self.tmp_dir.name, 'config.py')
+        with open(config_file, 'w') as f:
+            f.write(f"SQLALCHEMY_DATABASE_URI = {paths['primary']!r}\n"
+                    f"SQLALCHEMY_REPLICA_URIS = {[paths['replica_0'], paths['replica_1']]!r}\n")
+        self.app = create_app(config_file)
+
+        with self.app.app_context():
+            for bind in (None, 'replica_0', 'replica_1'):
+                engine = db.get_engine(self.app, bind=bind)
+                db.Model.metadata.create_all(engine)
+                with engine.begin() as connection:
+                    connection.execute(Actor.__table__.insert(),
+                                       {'id': 1, 'name': bind or 'primary', 'gender': 'Male',
+                                        'birth_date': datetime(2000, 1, 1)})
+
+    def get_actor_name(self, method='GET'):
+        with self.app.test_request_context('/actors', method=method):
+            name = Actor.query.get(1).name
+            db.session.remove()
+        return name
+
+    def test_reads_are_balanced_across_replicas(self):
+        self.assertEqual({self.get_actor_name() for _ in range(4)}, {'replica_0', 'replica_1'})
+
+    def test_other_methods_use_primary(self):
+        self.assertEqual(self.get_actor_name('POST'), 'primary')
+
+    def test_reads_after_write_use_primary(self):
+        with self.app.test_request_context('/actors', method='GET'):
+            Actor(name='new', gender='Male', birth_date=datetime(2000, 1, 1)).insert()
+            self.assertEqual(Actor.query.get(1).name, 'primary')
+            db.session.remove()
+
+    def test_primary_reads(self):
+        with self.app.test_request_context('/actors', method='GET'):
+            with primary_reads():
+                self.assertEqual(Actor.query.get(1).name, 'primary')
+            self.assertIn(Actor.query.get(1).name, ('replica_0', 'replica_1'))
+            db.session.remove()
+
+    def test_co_star_index_reads_primary(self):
+        # The replicas lag behind: the appearance and its change version are only on the primary
+        with self.app.app_context():
+            db.session.add_all([Movie(id=1, title='primary', release_date=datetime(2000, 1, 1)),
+                                Appearance(actor_id=1, movie_id=1)])
+            db.session.commit()
+            version, = get_change_versions('appearances')
+        costar_index.clear()
+        try:
+            with self.app.test_request_context('/actors/1/co-stars', method='GET'):
+                costar_index.refresh()
+                db.session.remove()
+            self.assertEqual(costar_index.stats()['version'], version)
+            self.assertEqual(costar_index.stats()['edges'], 1)
+        finally:
+            costar_index.clear()
+
+    def test_unhealthy_replica_is_skipped(self):
+        # A directory in place of the database file makes every connection fail
+        replica_file = os.path.join(self.tmp_dir.name, 'replica_0.db')
+        os.remove(replica_file)
+        os.mkdir(replica_file)
+        self.assertEqual({self.get_actor_name() for _ in range(4)}, {'replica_1'})
+
+    def tearDown(self):
+        """Executed after all tests"""
+        with self.app.app_context():
+            db.session.remove()
+            for bind in (None, 'replica_0', 'replica_1'):
+                db.get_engine(self.app, bind=bind).dispose()
+        self.tmp_dir.cleanup()
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()